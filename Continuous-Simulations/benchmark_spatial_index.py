@@ -0,0 +1,48 @@
+"""Compares the collision check of the spatial index against the linear scan Grid.is_blocked used to do, for an
+increasing number of obstacles (at a constant obstacle density)."""
+import argparse
+import random
+import time
+
+from continuous import Square
+from spatial_index import SpatialHash
+
+
+def random_squares(n, arena_size, min_size=0.2, max_size=1.0):
+    squares = []
+    for i in range(n):
+        size_x, size_y = random.uniform(min_size, max_size), random.uniform(min_size, max_size)
+        x, y = random.uniform(0, arena_size - size_x), random.uniform(0, arena_size - size_y)
+        squares.append(Square(x, x + size_x, y, y + size_y))
+    return squares
+
+
+def time_per_query(check, queries):
+    started = time.perf_counter()
+    hits = sum(check(box) for box in queries)
+    return (time.perf_counter() - started) / len(queries), hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--density', type=float, default=0.1, help='obstacles per unit of area')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    print(f"{'obstacles':>10} {'linear (us)':>12} {'index (us)':>12} {'speedup':>8}")
+    for n in args.sizes:
+        arena_size = (n / args.density) ** 0.5
+        obstacles = random_squares(n, arena_size)
+        # Robot sized query boxes:
+        queries = random_squares(args.queries, arena_size, 1, 1)
+        index = SpatialHash.bulk_load(enumerate(obstacles))
+        linear, linear_hits = time_per_query(lambda box: any([ob.intersect(box) for ob in obstacles]), queries)
+        indexed, indexed_hits = time_per_query(index.any, queries)
+        assert linear_hits == indexed_hits
+        print(f'{n:>10} {linear * 1e6:>12.2f} {indexed * 1e6:>12.2f} {linear / indexed:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
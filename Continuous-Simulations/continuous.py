@@ -1,13 +1,7 @@
 import numpy as np
-import matplotlib
-
-matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
-from copy import deepcopy
 import random
 import ast
-
-plt.ion()
+from spatial_index import SpatialHash
 import time
 
 
@@ -32,23 +26,21 @@ class Grid:
         self.height = height
         self.obstacles = []
         self.goals = []
+        # All goals ever put on the grid, reached ones are removed from goals but stay here:
+        self.all_goals = []
         self.robots = []
-
-        self.fig = plt.figure()
-        axes = self.fig.add_subplot(111)
-        self.border_line, = plt.plot(*self.get_border_coords(), color='black')
-        self.obstacle_lines = []
-        self.goal_lines = []
-        self.robot_lines = []
+        # Spatial indices for the collision and goal checks, the keys are the indices in the lists above:
+        self.obstacle_index = SpatialHash()
+        self.goal_index = SpatialHash()
+        self.robot_index = SpatialHash()
+        # Created by plot_grid:
+        self.plot = None
 
     def spawn_robots(self, robots, starting_positions):
         self.robots = robots
         for i, robot in enumerate(robots):
             robot.spawn(self, *starting_positions[i])
-            robot_box = robot.history[-1]
-            self.robot_lines.append(plt.plot([robot_box.x1, robot_box.x2, robot_box.x2, robot_box.x1, robot_box.x1],
-                                             [robot_box.y1, robot_box.y1, robot_box.y2, robot_box.y2, robot_box.y1],
-                                             color='blue')[0])
+            self.robot_index.insert(robot.id, robot.bounding_box)
         for robot in robots:
             if self.is_blocked(robot):
                 raise ValueError('Invalid starting pos, position is blocked!')
@@ -59,46 +51,96 @@ class Grid:
     def put_obstacle(self, x, y, size_x, size_y):
         assert self.is_in_bounds(x, y, size_x, size_y)
         ob = Square(x, x + size_x, y, y + size_y)
+        self.obstacle_index.insert(len(self.obstacles), ob)
         self.obstacles.append(ob)
-        self.obstacle_lines.append(
-            plt.plot([ob.x1, ob.x2, ob.x2, ob.x1, ob.x1], [ob.y1, ob.y1, ob.y2, ob.y2, ob.y1], color='black')[0])
 
     def put_goal(self, x, y, size_x, size_y):
         assert self.is_in_bounds(x, y, size_x, size_y)
         goal = Square(x, x + size_x, y, y + size_y)
+        self.goal_index.insert(len(self.all_goals), goal)
         self.goals.append(goal)
-        self.goal_lines.append(
-            plt.plot([goal.x1, goal.x2, goal.x2, goal.x1, goal.x1], [goal.y1, goal.y1, goal.y2, goal.y2, goal.y1],
-                     color='orange')[0])
+        self.all_goals.append(goal)
 
     def check_goals(self, robot):
-        for i, goal in enumerate(self.goals):
-            if goal.intersect(robot.bounding_box):
-                self.goals.remove(goal)
-                self.goal_lines[i].set_data(None, None)
-
-    def is_blocked(self, robot):
-        blocked_by_obstacle = any([ob.intersect(robot.bounding_box) for ob in self.obstacles])
-        blocked_by_robot = any(
-            [robot.bounding_box.intersect(other_robot.bounding_box) for other_robot in self.robots if
-             other_robot.id != robot.id])
-        return blocked_by_obstacle or blocked_by_robot
+        for i in self.goal_index.query(robot.bounding_box):
+            self.goals.remove(self.goal_index.boxes[i])
+            self.goal_index.remove(i)
+
+    def is_blocked(self, robot, box=None):
+        """Checks if the robot, or the given box the robot would occupy, overlaps an obstacle or another robot."""
+        box = box or robot.bounding_box
+        return self.obstacle_index.any(box) or self.robot_index.any(box, exclude=robot.id)
+
+    def is_blocked_at(self, robot, x, y):
+        """Same as is_blocked, for the robot at position (x, y), without creating a box."""
+        x2, y2 = x + robot.size, y + robot.size
+        return self.obstacle_index.overlaps(x, x2, y, y2) or self.robot_index.overlaps(x, x2, y, y2,
+                                                                                       exclude=robot.id)
+
+    def move_robot(self, robot):
+        """Updates the index after the bounding box of the robot moved."""
+        self.robot_index.update(robot.id, robot.bounding_box)
 
     def get_border_coords(self):
         return [0, self.width, self.width, 0, 0], [0, 0, self.height, self.height, 0]
 
+    # The same read-only view of the state as engine.Engine has, which is what plotting.GridPlot draws:
+    def obstacle_boxes(self):
+        return np.array([(ob.x1, ob.x2, ob.y1, ob.y2) for ob in self.obstacles], dtype=float).reshape(-1, 4)
+
+    def goal_boxes(self):
+        return np.array([(goal.x1, goal.x2, goal.y1, goal.y2) for goal in self.all_goals], dtype=float).reshape(-1, 4)
+
+    def goals_reached(self):
+        return np.array([i not in self.goal_index.boxes for i in range(len(self.all_goals))], dtype=bool)
+
+    def robot_boxes(self):
+        return np.array([(robot.bounding_box.x1, robot.bounding_box.x2, robot.bounding_box.y1, robot.bounding_box.y2)
+                         for robot in self.robots], dtype=float).reshape(-1, 4)
+
+    def battery_levels(self):
+        return [robot.battery_lvl for robot in self.robots]
+
     def plot_grid(self):
-        for i, robot in enumerate(self.robots):
-            robot_box = robot.history[-1]
-            self.robot_lines[i].set_xdata([robot_box.x1, robot_box.x2, robot_box.x2, robot_box.x1, robot_box.x1])
-            self.robot_lines[i].set_ydata([robot_box.y1, robot_box.y1, robot_box.y2, robot_box.y2, robot_box.y1])
-        plt.title('Battery levels: ' + '|'.join([str(round(robot.battery_lvl, 2)) for robot in self.robots]))
-        plt.draw()
-        plt.pause(0.0001)
+        """Draws the grid in a matplotlib figure, which is created on the first call."""
+        if self.plot is None:
+            from plotting import GridPlot
+            self.plot = GridPlot(self)
+        self.plot(self)
+
+
+class PositionHistory:
+    """Growable array of the (x, y) positions of a robot, doubling its capacity when full. With stride > 1 only every
+    stride-th position is kept."""
+
+    def __init__(self, stride=1, capacity=256):
+        self.stride = stride
+        self.data = np.empty((capacity, 2))
+        self.length = 0
+        self.n_seen = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.positions[i]
+
+    @property
+    def positions(self):
+        return self.data[:self.length]
+
+    def append(self, x, y):
+        self.n_seen += 1
+        if (self.n_seen - 1) % self.stride != 0:
+            return
+        if self.length == len(self.data):
+            self.data = np.concatenate((self.data, np.empty_like(self.data)))
+        self.data[self.length] = x, y
+        self.length += 1
 
 
 class Robot:
-    def __init__(self, id, size=1, battery_drain_p=0, battery_drain_lam=0):
+    def __init__(self, id, size=1, battery_drain_p=0, battery_drain_lam=0, history_stride=1):
         self.size = size
         self.id = id
         self.direction_vector = (0, 0)
@@ -106,11 +148,13 @@ class Robot:
         self.battery_drain_lam = battery_drain_lam
         self.battery_lvl = 100
         self.alive = True
+        self.history_stride = history_stride
 
     def spawn(self, grid, start_x=0, start_y=0):
         self.pos = (start_x, start_y)
         self.bounding_box = Square(start_x, start_x + self.size, start_y, start_y + self.size)
-        self.history = [self.bounding_box]
+        self.history = PositionHistory(self.history_stride)
+        self.history.append(start_x, start_y)
         self.grid = grid
         assert self.grid.is_in_bounds(start_x, start_y, self.size, self.size)
 
@@ -125,14 +169,11 @@ class Robot:
         if self.alive:
             if self.direction_vector == (0, 0):  # Literally 0 speed so no movement.
                 return False
-            new_pos = tuple(np.array(self.pos) + self.direction_vector)
-            # Temporarily set the new bounding box:
-            new_box = deepcopy(self.bounding_box)
-            new_box.update_pos(*new_pos)
-            self.bounding_box = new_box
-            if self.grid.is_blocked(self):
+            new_x, new_y = self.pos[0] + self.direction_vector[0], self.pos[1] + self.direction_vector[1]
+            # Check the new position before moving:
+            if self.grid.is_blocked_at(self, new_x, new_y):
                 return False
-            elif not self.grid.is_in_bounds(new_pos[0], new_pos[1], self.size, self.size):
+            elif not self.grid.is_in_bounds(new_x, new_y, self.size, self.size):
                 return False
             else:
                 do_battery_drain = np.random.binomial(1, self.battery_drain_p)
@@ -143,10 +184,10 @@ class Robot:
                         self.alive = False
                         self.battery_lvl = 0
                         return False
-                del new_box
-                self.pos = new_pos
-                self.bounding_box.update_pos(*self.pos)
-                self.history.append(self.bounding_box)
+                self.pos = (new_x, new_y)
+                self.bounding_box.update_pos(new_x, new_y)
+                self.grid.move_robot(self)
+                self.history.append(new_x, new_y)
                 # Check if in this position we have reached a goal:
                 self.grid.check_goals(self)
                 return True
@@ -181,20 +222,27 @@ def parse_config(file):
             return grid
 
 
-grid = parse_config('example.grid')
-grid.spawn_robots([Robot(id=1, battery_drain_p=0.5, battery_drain_lam=10),
-                   Robot(id=2, battery_drain_p=0.2, battery_drain_lam=10)],
-                  [(0, 0), (1, 2)])
-
-while True:
+if __name__ == '__main__':
+    import matplotlib
+
+    matplotlib.use("TkAgg")
+    import matplotlib.pyplot as plt
+
+    plt.ion()
+    grid = parse_config('example.grid')
+    grid.spawn_robots([Robot(id=1, battery_drain_p=0.5, battery_drain_lam=10),
+                       Robot(id=2, battery_drain_p=0.2, battery_drain_lam=10)],
+                      [(0, 0), (1, 2)])
+
+    while True:
+        grid.plot_grid()
+        # Stop simulation if all robots died:
+        if all([not robot.alive for robot in grid.robots]):
+            break
+        for robot in grid.robots:
+            # To avoid deadlocks, only try to move alive robots:
+            if robot.alive:
+                if not robot.move(p_random=0.05):
+                    robot.direction_vector = (0.1, 0.1)
     grid.plot_grid()
-    # Stop simulation if all robots died:
-    if all([not robot.alive for robot in grid.robots]):
-        break
-    for robot in grid.robots:
-        # To avoid deadlocks, only try to move alive robots:
-        if robot.alive:
-            if not robot.move(p_random=0.05):
-                robot.direction_vector = (0.1, 0.1)
-grid.plot_grid()
-time.sleep(3)
+    time.sleep(3)
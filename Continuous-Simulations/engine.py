@@ -0,0 +1,377 @@
+"""Headless, vectorized engine for the continuous simulation.
+
+The state of all robots (positions, direction vectors, battery levels) is kept in numpy arrays and every step moves
+all robots at once, with the bounds and collision (AABB) tests done on arrays of boxes. Besides fixed steps (step),
+the engine can move robots with swept collision (advance): every call moves the robots as far as their velocities
+allow until the first contact with a wall, obstacle, robot or goal. Nothing is drawn unless an observer, like
+plotting.GridPlot, is attached:
+    python engine.py example.grid --steps 10000
+    python engine.py example.grid --swept
+    python engine.py example.grid --render --frame-stride 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from continuous import parse_config
+
+# Time (in ticks) below which boxes that move apart are not considered in contact, see impact_times:
+CONTACT_TOLERANCE = 1e-9
+
+
+def boxes_overlap(a, b):
+    """Square.intersect of every box in a with every box in b, both (n, 4) arrays of (x1, x2, y1, y2) rows.
+    Returns an (len(a), len(b)) bool array."""
+    a, b = a[:, None, :], b[None, :, :]
+    intersecting = ~((a[..., 1] <= b[..., 0]) | (a[..., 0] >= b[..., 1]) |
+                     (a[..., 3] <= b[..., 2]) | (a[..., 2] >= b[..., 3]))
+    inside = ((b[..., 0] >= a[..., 0]) & (b[..., 1] <= a[..., 1]) &
+              (b[..., 2] >= a[..., 2]) & (b[..., 3] <= a[..., 3]))
+    return intersecting | inside
+
+
+def axis_times(lo, hi, other_lo, other_hi, v):
+    """Times at which the interval (lo, hi), moving with velocity v, starts and stops overlapping (other_lo,
+    other_hi). Never overlapping gives (inf, -inf), always overlapping (-inf, inf)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (other_lo - hi) / v
+        t2 = (other_hi - lo) / v
+    overlapping = (lo < other_hi) & (hi > other_lo)
+    entry = np.where(v > 0, t1, np.where(v < 0, t2, np.where(overlapping, -np.inf, np.inf)))
+    exit = np.where(v > 0, t2, np.where(v < 0, t1, np.where(overlapping, np.inf, -np.inf)))
+    return entry, exit
+
+
+def impact_times(boxes, velocity, others, other_velocity=None):
+    """Swept AABB test: time of impact of every box in boxes (n, 4) moving with velocity (n, 2) with every box in
+    others (m, 4), which move with other_velocity (m, 2) or stand still. Returns an (n, m) array which is inf for
+    pairs that never touch, and 0 for pairs that already overlap and do not move apart."""
+    a, b = boxes[:, None, :], others[None, :, :]
+    v = velocity[:, None, :]
+    if other_velocity is not None:
+        v = v - other_velocity[None, :, :]
+    x_entry, x_exit = axis_times(a[..., 0], a[..., 1], b[..., 0], b[..., 1], v[..., 0])
+    y_entry, y_exit = axis_times(a[..., 2], a[..., 3], b[..., 2], b[..., 3], v[..., 1])
+    entry, exit = np.maximum(x_entry, y_entry), np.minimum(x_exit, y_exit)
+    # Boxes that touch after a contact can overlap by a rounding error, which should not block moving apart:
+    return np.where((entry < exit) & (exit > CONTACT_TOLERANCE), np.maximum(entry, 0), np.inf)
+
+
+def first(times):
+    """Minimum over the rows of an (n, m) array of times, and the column it is in (-1 for empty arrays)."""
+    if times.shape[1] == 0:
+        return np.full(len(times), np.inf), np.full(len(times), -1)
+    column = times.argmin(axis=1)
+    return times[np.arange(len(times)), column], column
+
+
+def bounce(engine, moved):
+    """The policy of the example in continuous.py: robots that could not move go diagonally up."""
+    engine.direction[~moved & engine.alive] = 0.1
+
+
+class Engine:
+    """Continuous simulation of n robots on a width x height area with box obstacles and goals.
+    The rules are the ones of continuous.Robot.move, applied to all robots at once: a robot dies when there are no
+    goals left, a move is blocked when the new box is out of bounds or overlaps an obstacle or another robot, and a
+    successful move drains the battery with probability battery_drain_p. Robots move simultaneously, so a move is
+    also blocked when the new box overlaps the new box of another robot that moves in the same step."""
+
+    def __init__(self, width, height, obstacles, goals, positions, sizes=1, battery_drain_p=0, battery_drain_lam=0,
+                 seed=None):
+        self.width = width
+        self.height = height
+        self.obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 4)
+        self.goals = np.asarray(goals, dtype=float).reshape(-1, 4)
+        self.goal_reached = np.zeros(len(self.goals), dtype=bool)
+        self.pos = np.asarray(positions, dtype=float).reshape(-1, 2).copy()
+        n = len(self.pos)
+        self.size = np.broadcast_to(np.asarray(sizes, dtype=float), (n,)).copy()
+        self.direction = np.zeros((n, 2))
+        self.battery_lvl = np.full(n, 100.0)
+        self.battery_drain_p = np.broadcast_to(np.asarray(battery_drain_p, dtype=float), (n,)).copy()
+        self.battery_drain_lam = np.broadcast_to(np.asarray(battery_drain_lam, dtype=float), (n,)).copy()
+        self.alive = np.ones(n, dtype=bool)
+        self.n_moves = np.zeros(n, dtype=np.int64)
+        self.distance = np.zeros(n)
+        # Simulated time in ticks (one step is one tick) and the number of step/advance calls:
+        self.time = 0.0
+        self.n_steps = 0
+        # Time of the next random move of every robot in swept mode, see advance:
+        self.next_random = np.full(n, np.inf)
+        self.rng = np.random.default_rng(seed)
+        # (observer, frame_stride) pairs, see attach:
+        self.observers = []
+
+        boxes = self.robot_boxes()
+        if not self.in_bounds(boxes).all():
+            raise ValueError('Invalid starting pos, position is out of bounds!')
+        robot_overlap = boxes_overlap(boxes, boxes)
+        np.fill_diagonal(robot_overlap, False)
+        if boxes_overlap(self.obstacles, boxes).any() or robot_overlap.any():
+            raise ValueError('Invalid starting pos, position is blocked!')
+
+    @classmethod
+    def from_grid(cls, grid, robots, starting_positions, seed=None):
+        """Builds an engine for a continuous.Grid (e.g. from parse_config) and continuous.Robot objects, which are
+        only used for their size and battery drain parameters."""
+        return cls(grid.width, grid.height, grid.obstacle_boxes(),
+                   [(goal.x1, goal.x2, goal.y1, goal.y2) for goal in grid.goals], starting_positions,
+                   sizes=[robot.size for robot in robots],
+                   battery_drain_p=[robot.battery_drain_p for robot in robots],
+                   battery_drain_lam=[robot.battery_drain_lam for robot in robots], seed=seed)
+
+    @property
+    def n_robots(self):
+        return len(self.pos)
+
+    @property
+    def goals_left(self):
+        return int((~self.goal_reached).sum())
+
+    def robot_boxes(self, pos=None):
+        """(n, 4) array of the boxes of the robots at pos (their current positions by default)."""
+        pos = self.pos if pos is None else pos
+        return np.stack((pos[:, 0], pos[:, 0] + self.size, pos[:, 1], pos[:, 1] + self.size), axis=1)
+
+    def in_bounds(self, boxes):
+        return (boxes[:, 0] >= 0) & (boxes[:, 1] <= self.width) & (boxes[:, 2] >= 0) & (boxes[:, 3] <= self.height)
+
+    # The same read-only view of the state as continuous.Grid has, which is what plotting.GridPlot draws:
+    def obstacle_boxes(self):
+        return self.obstacles
+
+    def goal_boxes(self):
+        return self.goals
+
+    def goals_reached(self):
+        return self.goal_reached
+
+    def battery_levels(self):
+        return self.battery_lvl
+
+    def attach(self, observer, frame_stride=1):
+        """Calls observer(engine) after every frame_stride-th step (and once more when run finishes)."""
+        self.observers.append((observer, frame_stride))
+
+    def notify(self, force=False):
+        for observer, frame_stride in self.observers:
+            if force or self.n_steps % frame_stride == 0:
+                observer(self)
+
+    def step(self, p_random=0):
+        """Moves all robots one step along their direction vectors, returns a bool array of the robots that moved."""
+        n = self.n_robots
+        self.n_steps += 1
+        self.time += 1
+        # Random moves:
+        random_move = self.rng.random(n) < p_random
+        self.direction[random_move] = self.rng.uniform(-0.1, 0.1, (random_move.sum(), 2))
+        # If there are no goals left, die:
+        if self.goal_reached.all():
+            self.alive[:] = False
+        moving = self.alive & self.direction.any(axis=1)
+        if not moving.any():
+            return moving
+        new_pos = self.pos + self.direction
+        new_boxes = self.robot_boxes(new_pos)
+        valid = moving & self.in_bounds(new_boxes)
+        if len(self.obstacles):
+            valid &= ~boxes_overlap(self.obstacles, new_boxes).any(axis=0)
+        # Other robots block at their current position, and at their new position if they move as well:
+        others = boxes_overlap(self.robot_boxes(), new_boxes) | (boxes_overlap(new_boxes, new_boxes) & valid[:, None])
+        np.fill_diagonal(others, False)
+        valid &= ~others.any(axis=0)
+        # Battery drain, a robot that runs empty dies before it moves:
+        drain = valid & (self.rng.random(n) < self.battery_drain_p) & (self.battery_lvl > 0)
+        amount = self.rng.exponential(1.0, n) * self.battery_drain_lam * np.abs(self.direction.sum(axis=1))
+        self.battery_lvl[drain] -= amount[drain]
+        empty = drain & (self.battery_lvl <= 0)
+        self.alive[empty] = False
+        self.battery_lvl[empty] = 0
+        moved = valid & ~empty
+        self.pos[moved] = new_pos[moved]
+        self.n_moves += moved
+        self.distance[moved] += np.hypot(self.direction[moved, 0], self.direction[moved, 1])
+        # Check which goals were reached in the new positions:
+        if moved.any() and not self.goal_reached.all():
+            self.goal_reached |= boxes_overlap(self.goals, new_boxes[moved]).any(axis=1)
+        return moved
+
+    def blocking_contacts(self, velocity):
+        """Time of the first contact of every robot with a wall, obstacle or other robot when moving with velocity,
+        with the kind of contact (index in BLOCKERS) and the index of the obstacle or robot."""
+        boxes = self.robot_boxes()
+        # Walls, the time until the box reaches the border in the direction it moves:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_x = np.where(velocity[:, 0] > 0, (self.width - boxes[:, 1]) / velocity[:, 0],
+                           np.where(velocity[:, 0] < 0, -boxes[:, 0] / velocity[:, 0], np.inf))
+            t_y = np.where(velocity[:, 1] > 0, (self.height - boxes[:, 3]) / velocity[:, 1],
+                           np.where(velocity[:, 1] < 0, -boxes[:, 2] / velocity[:, 1], np.inf))
+        t_wall = np.maximum(np.minimum(t_x, t_y), 0)
+        t_obstacle, obstacle = first(impact_times(boxes, velocity, self.obstacles))
+        robot_times = impact_times(boxes, velocity, boxes, velocity)
+        np.fill_diagonal(robot_times, np.inf)
+        t_robot, robot = first(robot_times)
+        times = np.stack((t_wall, t_obstacle, t_robot), axis=1)
+        kind = times.argmin(axis=1)
+        other = np.stack((np.full(len(boxes), -1), obstacle, robot), axis=1)[np.arange(len(boxes)), kind]
+        return times[np.arange(len(boxes)), kind], kind, other
+
+    BLOCKERS = ('wall', 'obstacle', 'robot')
+
+    def advance(self, max_time=np.inf, p_random=0):
+        """Swept collision stepping: moves all robots along their direction vectors (velocities, in distance per
+        tick) until the first event or for max_time ticks, whichever comes first. Events are (time, robot, kind,
+        other) tuples at the exact time they happen:
+            'wall', 'obstacle', 'robot': the robot touches a blocker (other is the index of the obstacle or robot)
+                and stops there, robots that touch a blocker at the start of the call do not move at all.
+            'goal': the robot reached goal other.
+            'battery': the battery ran empty and the robot died.
+            'random': random move, the robot got a random direction vector. With p_random the robots make a random
+                move with that probability per tick, like step does.
+        Battery drain over t ticks is the sum of the exponential drains of Binomial(t, battery_drain_p) ticks,
+        spread evenly over the distance moved. Returns (events, moved), with moved the robots that were not
+        blocked, so it works with the same policies as step."""
+        n = self.n_robots
+        self.n_steps += 1
+        start = self.time
+        if p_random > 0:
+            waiting = np.isinf(self.next_random)
+            self.next_random[waiting] = start + self.rng.geometric(p_random, waiting.sum())
+        # If there are no goals left, die:
+        if self.goal_reached.all():
+            self.alive[:] = False
+            return [], np.zeros(n, dtype=bool)
+        velocity = np.where(self.alive[:, None], self.direction, 0.0)
+        # Robots that are blocked right away stand still, which changes the impact times of the other robots:
+        stalled = np.zeros(n, dtype=bool)
+        events = []
+        while True:
+            t_block, kind, other = self.blocking_contacts(velocity)
+            stall = (t_block <= 0) & velocity.any(axis=1)
+            if not stall.any():
+                break
+            events += [(start, i, self.BLOCKERS[kind[i]], int(other[i])) for i in np.flatnonzero(stall)]
+            stalled |= stall
+            velocity[stall] = 0
+        moving = velocity.any(axis=1)
+        remaining_goals = np.flatnonzero(~self.goal_reached)
+        t_goal, goal = first(impact_times(self.robot_boxes(), velocity, self.goals[remaining_goals]))
+        t_goal[~moving] = np.inf
+        dt = min(max_time, t_block[moving].min(initial=np.inf), t_goal.min(initial=np.inf),
+                 (self.next_random - start).min())
+        if np.isinf(dt):
+            # Nothing moves and nothing will happen:
+            return events, ~stalled
+        # Battery drain over the segment, a robot that runs empty dies on the way:
+        ticks = np.floor(dt) + (self.rng.random(n) < dt - np.floor(dt))
+        drains = self.rng.binomial(ticks.astype(np.int64), self.battery_drain_p)
+        amount = self.rng.gamma(drains, 1.0) * self.battery_drain_lam * np.abs(velocity.sum(axis=1))
+        amount[~moving | (self.battery_lvl <= 0)] = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_empty = np.where(amount >= self.battery_lvl, dt * self.battery_lvl / amount, np.inf)
+        if t_empty.min() < dt:
+            # Stop at the first robot that runs empty, the others only drain their share of the segment:
+            new_dt = t_empty.min()
+            amount *= new_dt / dt
+            dt = new_dt
+        self.pos += velocity * dt
+        self.distance += np.hypot(velocity[:, 0], velocity[:, 1]) * dt
+        self.battery_lvl -= amount
+        self.time = start + dt
+        for i in np.flatnonzero(moving & (t_block <= dt)):
+            events.append((self.time, i, self.BLOCKERS[kind[i]], int(other[i])))
+        for i in np.flatnonzero(t_goal <= dt):
+            if not self.goal_reached[remaining_goals[goal[i]]]:
+                self.goal_reached[remaining_goals[goal[i]]] = True
+                events.append((self.time, i, 'goal', int(remaining_goals[goal[i]])))
+        for i in np.flatnonzero(t_empty <= dt):
+            self.alive[i] = False
+            self.battery_lvl[i] = 0
+            events.append((self.time, i, 'battery', -1))
+        blocked = stalled | (moving & (t_block <= dt))
+        for i in np.flatnonzero(self.next_random <= self.time):
+            self.direction[i] = self.rng.uniform(-0.1, 0.1, 2)
+            self.next_random[i] = np.inf
+            # The robot has a new direction to try, so the policy should not change it:
+            blocked[i] = False
+            events.append((self.time, i, 'random', -1))
+        return events, ~blocked
+
+    def run_swept(self, p_random=0, policy=bounce, max_time=None):
+        """Same as run, with advance instead of step, until all robots died or the time is up. Returns the number of
+        advance calls."""
+        self.notify(force=True)
+        while self.alive.any() and (max_time is None or self.time < max_time):
+            start = self.time
+            events, moved = self.advance(np.inf if max_time is None else max_time - start, p_random)
+            if not events and self.time == start:
+                break
+            if policy is not None:
+                policy(self, moved)
+            self.notify()
+        self.notify(force=True)
+        return self.n_steps
+
+    def run(self, p_random=0, policy=bounce, max_steps=None):
+        """Steps until all robots died (or max_steps), calling policy(engine, moved) after every step to let the
+        robots pick new directions. Returns the number of steps."""
+        self.notify(force=True)
+        while self.alive.any() and (max_steps is None or self.n_steps < max_steps):
+            moved = self.step(p_random)
+            if policy is not None:
+                policy(self, moved)
+            self.notify()
+        self.notify(force=True)
+        return self.n_steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the continuous simulation without (or with) a UI.')
+    parser.add_argument('config', nargs='?', default='example.grid', help='size/obstacle/goal config file')
+    parser.add_argument('--robot', type=float, nargs=4, action='append', dest='robots',
+                        metavar=('X', 'Y', 'DRAIN_P', 'DRAIN_LAM'),
+                        help='starting position and battery drain of a robot, repeat for more robots')
+    parser.add_argument('--size', type=float, default=1, help='size of the robots')
+    parser.add_argument('--p-random', type=float, default=0.05)
+    parser.add_argument('--steps', type=int, default=None, help='maximum number of steps')
+    parser.add_argument('--swept', action='store_true', help='use swept collision stepping instead of fixed steps')
+    parser.add_argument('--max-time', type=float, default=None, help='maximum number of ticks in swept mode')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--render', action='store_true', help='draw the simulation with matplotlib')
+    parser.add_argument('--frame-stride', type=int, default=1, help='steps between two frames when rendering')
+    args = parser.parse_args()
+
+    # Same robots as the example in continuous.py by default:
+    robots = args.robots or [(0, 0, 0.5, 10), (1, 2, 0.2, 10)]
+    grid = parse_config(args.config)
+    engine = Engine(grid.width, grid.height, grid.obstacle_boxes(), grid.goal_boxes(),
+                    [robot[:2] for robot in robots], sizes=args.size,
+                    battery_drain_p=[robot[2] for robot in robots],
+                    battery_drain_lam=[robot[3] for robot in robots], seed=args.seed)
+    if args.render:
+        import matplotlib
+
+        matplotlib.use("TkAgg")
+        import matplotlib.pyplot as plt
+        from plotting import GridPlot
+
+        plt.ion()
+        engine.attach(GridPlot(engine), args.frame_stride)
+    started = time.perf_counter()
+    if args.swept:
+        n_steps = engine.run_swept(p_random=args.p_random, max_time=args.max_time)
+    else:
+        n_steps = engine.run(p_random=args.p_random, max_steps=args.steps)
+    elapsed = time.perf_counter() - started
+    print(f'{n_steps} steps ({engine.time:.1f} ticks) in {elapsed:.2f}s ({n_steps / max(elapsed, 1e-9):.0f} steps/s), '
+          f'goals reached: {int(engine.goal_reached.sum())}/{len(engine.goals)}')
+    for i in range(engine.n_robots):
+        print(f'robot {i}: pos ({engine.pos[i, 0]:.2f}, {engine.pos[i, 1]:.2f}), distance {engine.distance[i]:.2f}, '
+              f'battery {engine.battery_lvl[i]:.2f}, alive {engine.alive[i]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+def outline(box):
+    """x and y coordinates of the outline of a (x1, x2, y1, y2) box."""
+    x1, x2, y1, y2 = box
+    return [x1, x2, x2, x1, x1], [y1, y1, y2, y2, y1]
+
+
+class GridPlot:
+    """Matplotlib view of a continuous simulation, a continuous.Grid or an engine.Engine. Calling it with the
+    simulation redraws the robots and the reached goals, so it can be attached to an Engine as an observer.
+    matplotlib is only imported here, so the simulations themselves run without a display."""
+
+    def __init__(self, sim, pause=0.0001):
+        import matplotlib.pyplot as plt
+        self.plt = plt
+        self.pause = pause
+        self.fig = plt.figure()
+        self.axes = self.fig.add_subplot(111)
+        self.axes.plot(*outline((0, sim.width, 0, sim.height)), color='black')
+        for box in sim.obstacle_boxes():
+            self.axes.plot(*outline(box), color='black')
+        self.goal_lines = [self.axes.plot(*outline(box), color='orange')[0] for box in sim.goal_boxes()]
+        self.robot_lines = [self.axes.plot(*outline(box), color='blue')[0] for box in sim.robot_boxes()]
+
+    def __call__(self, sim):
+        for line, box in zip(self.robot_lines, sim.robot_boxes()):
+            line.set_data(*outline(box))
+        for line, reached in zip(self.goal_lines, sim.goals_reached()):
+            if reached:
+                line.set_data([], [])
+        self.axes.set_title('Battery levels: ' + '|'.join([str(round(lvl, 2)) for lvl in sim.battery_levels()]))
+        self.fig.canvas.draw_idle()
+        if self.pause:
+            self.plt.pause(self.pause)
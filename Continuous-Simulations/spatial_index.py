@@ -0,0 +1,96 @@
+import math
+
+
+class SpatialHash:
+    """Uniform hash grid over axis aligned boxes (anything with x1, x2, y1, y2 attributes, like Square). Every box is
+    stored in the buckets of all cells of size cell_size it overlaps, so a query only has to test the boxes in the
+    few buckets around the query box instead of every box."""
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.buckets = {}
+        # Box and bucket range of every key:
+        self.boxes = {}
+        self.ranges = {}
+
+    @classmethod
+    def bulk_load(cls, items, cell_size=None):
+        """Builds an index from (key, box) pairs. By default the cell size is the mean box size, which keeps the
+        number of buckets per box and of boxes per bucket small."""
+        items = list(items)
+        if cell_size is None:
+            sizes = [max(box.x2 - box.x1, box.y2 - box.y1) for key, box in items]
+            cell_size = (sum(sizes) / len(sizes)) if sizes and sum(sizes) > 0 else 1.0
+        index = cls(cell_size)
+        for key, box in items:
+            index.insert(key, box)
+        return index
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _range(self, x1, x2, y1, y2):
+        return (math.floor(x1 / self.cell_size), math.floor(x2 / self.cell_size),
+                math.floor(y1 / self.cell_size), math.floor(y2 / self.cell_size))
+
+    def insert(self, key, box):
+        bucket_range = self._range(box.x1, box.x2, box.y1, box.y2)
+        self.boxes[key] = box
+        self.ranges[key] = bucket_range
+        x1, x2, y1, y2 = bucket_range
+        for i in range(x1, x2 + 1):
+            for j in range(y1, y2 + 1):
+                self.buckets.setdefault((i, j), set()).add(key)
+
+    def remove(self, key):
+        x1, x2, y1, y2 = self.ranges.pop(key)
+        del self.boxes[key]
+        for i in range(x1, x2 + 1):
+            for j in range(y1, y2 + 1):
+                bucket = self.buckets[(i, j)]
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[(i, j)]
+
+    def update(self, key, box):
+        """Moves a box (or registers that it was moved in place), only touches the buckets if it moved into other
+        cells."""
+        if self._range(box.x1, box.x2, box.y1, box.y2) == self.ranges[key]:
+            self.boxes[key] = box
+        else:
+            self.remove(key)
+            self.insert(key, box)
+
+    def query(self, box, exclude=None):
+        """Returns the keys of the boxes that intersect box (see Square.intersect), except exclude."""
+        x1, x2, y1, y2 = self._range(box.x1, box.x2, box.y1, box.y2)
+        candidates = set()
+        for i in range(x1, x2 + 1):
+            for j in range(y1, y2 + 1):
+                candidates.update(self.buckets.get((i, j), ()))
+        candidates.discard(exclude)
+        return [key for key in candidates if intersect(self.boxes[key], box)]
+
+    def any(self, box, exclude=None):
+        """Returns True if any box intersects box, stops at the first hit."""
+        return self.overlaps(box.x1, box.x2, box.y1, box.y2, exclude)
+
+    def overlaps(self, x1, x2, y1, y2, exclude=None):
+        """Same as any, for the box given by its coordinates, so no box has to be created for the query."""
+        i1, i2, j1, j2 = self._range(x1, x2, y1, y2)
+        for i in range(i1, i2 + 1):
+            for j in range(j1, j2 + 1):
+                for key in self.buckets.get((i, j), ()):
+                    if key != exclude:
+                        box = self.boxes[key]
+                        if not (box.x2 <= x1 or box.x1 >= x2 or box.y2 <= y1 or box.y1 >= y2) or (
+                                x1 >= box.x1 and x2 <= box.x2 and y1 >= box.y1 and y2 <= box.y2):
+                            return True
+        return False
+
+
+def intersect(a, b):
+    """Same test as Square.intersect, on anything with x1, x2, y1, y2 attributes."""
+    intersecting = not (a.x2 <= b.x1 or a.x1 >= b.x2 or a.y2 <= b.y1 or a.y1 >= b.y2)
+    inside = (b.x1 >= a.x1 and b.x2 <= a.x2 and b.y1 >= a.y1 and b.y2 <= a.y2)
+    return intersecting or inside
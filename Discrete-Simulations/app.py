@@ -10,70 +10,116 @@ import base64
 import numpy as np
 from io import BytesIO
 from flask_socketio import emit
-import pickle
 import os
+import re
 import ast
+import threading
+import time
 from matplotlib.figure import Figure
-from environment import Grid, Robot
-# Import all robot algorithms present in the robot_configs folder:
-from robot_configs import *
+from matplotlib.transforms import Affine2D
+from environment import Grid
+from fleet_environment import Fleet
+from grid_format import GRID_EXTENSION, decode_cells, save_grid, load_template
+from recording import Replay, list_recordings
+import instrumentation
+from robot_registry import RobotRegistry
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
+# Minimum number of seconds between two renders of the history plot during a simulation:
+app.config['PLOT_INTERVAL'] = 1.0
+# Largest grid (in cells) the editor can build, a run-length encoded payload is small for any size:
+app.config['MAX_GRID_CELLS'] = 4096 * 4096
+# Per phase timers, see instrumentation.py and the /metrics route, turned on with INSTRUMENT=1:
+app.config['INSTRUMENT'] = os.environ.get('INSTRUMENT', '0') == '1'
+if app.config['INSTRUMENT']:
+    instrumentation.enable()
 socketio = SocketIO(app)
 
-grid, robots = None, None
-occupied = False
 PATH = os.getcwd()
+# Robot algorithms in the robot_configs folder, imported when first used and reloaded when their file changes:
+robot_registry = RobotRegistry(PATH + '/robot_configs')
+# Recordings of episodes (headless.py --record recordings/...) that can be replayed in the browser:
+RECORDINGS = PATH + '/recordings'
 
 
-def draw_grid(grid):
-    """'Helper function for creating a JSON payload which will be displayed in the browser."""
-    global robots
-    materials = {0: 'cell_clean', -1: 'cell_wall', -2: 'cell_obstacle', -3: 'cell_robot_n', -4: 'cell_robot_e',
-                 -5: 'cell_robot_s', -6: 'cell_robot_w', 1: 'cell_dirty', 2: 'cell_goal', 3: 'cell_death'}
+# Names a grid can be saved under, no path separators so it always stays in the grid_configs folder:
+GRID_NAME = re.compile(r'[\w\- ]+')
+
+
+MATERIALS = {0: 'cell_clean', -1: 'cell_wall', -2: 'cell_obstacle', -3: 'cell_robot_n', -4: 'cell_robot_e',
+             -5: 'cell_robot_s', -6: 'cell_robot_w', 1: 'cell_dirty', 2: 'cell_goal', 3: 'cell_death'}
+
+
+@instrumentation.timed('stats')
+def grid_stats(grid, robots=None):
+    """Helper function for creating the statistics which are displayed next to the grid in the browser."""
     # Setting statistics:
-    clean = (grid.cells == 0).sum()
-    dirty = (grid.cells >= 1).sum()
-    goal = (grid.cells == 2).sum()
+    clean_percent = round(grid.stats.clean_percent, 2)
+    goal = grid.stats.goal
     if robots:  # If we have robots on the grid:
         efficiencies = [100 for i in range(len(robots))]
         batteries = [100 for i in range(len(robots))]
         alives = [True for i in range(len(robots))]
         for i, robot in enumerate(robots):
-            # Calculating efficiency:
-            moves = [(x, y) for (x, y) in zip(robot.history[0], robot.history[1])]
-            if len(moves) > 0:
-                u_moves = set(moves)
-                n_revisted_tiles = len(moves) - len(u_moves)
-                n_total_tiles = (grid.cells >= 0).sum()
-                efficiency = (100 * n_total_tiles) / (n_total_tiles + n_revisted_tiles)
-                efficiencies[i] = float(round(efficiency, 2))
+            efficiencies[i] = float(round(robot.efficiency, 2))
             # Min battery level is 0:
             battery = 0 if robot.battery_lvl < 0 else robot.battery_lvl
             # Battery and alive stats:
             batteries[i] = round(battery, 2)
             alives[i] = robot.alive
-        return {'grid': render_template('grid.html', height=30, width=30, n_rows=grid.n_rows, n_cols=grid.n_cols,
-                                        room_config=grid.cells,
-                                        materials=materials), 'clean': round((clean / (dirty + clean)) * 100, 2),
-                'goal': float(goal), 'efficiency': ','.join([str(i) for i in efficiencies]),
-                'battery': ','.join([str(i) for i in batteries]),
-                'alive': alives}
+        return {'clean': clean_percent, 'goal': float(goal), 'efficiency': ','.join([str(i) for i in efficiencies]),
+                'battery': ','.join([str(i) for i in batteries]), 'alive': alives}
     else:  # If we have an empty grid with no robots:
-        return {'grid': render_template('grid.html', height=30, width=30, n_rows=grid.n_rows, n_cols=grid.n_cols,
-                                        room_config=grid.cells,
-                                        materials=materials), 'clean': round((clean / (dirty + clean)) * 100, 2),
-                'goal': float(goal), 'efficiency': ',', 'battery': ',',
-                'alive': ','}
+        return {'clean': clean_percent, 'goal': float(goal), 'efficiency': ',', 'battery': ',', 'alive': ','}
+
+
+def display_cells(grid, robots=None):
+    """The cells to show in the browser. The robots of a fleet are kept in a layer of their own, and are painted on a
+    copy of the cells."""
+    fleet = getattr(robots[0], 'fleet', None) if robots else None
+    return fleet.render_cells() if fleet is not None else grid.cells
+
+
+@instrumentation.timed('render')
+def draw_grid(grid, robots=None):
+    """'Helper function for creating a JSON payload which will be displayed in the browser."""
+    return {'grid': render_template('grid.html', height=30, width=30, n_rows=grid.n_rows, n_cols=grid.n_cols,
+                                    room_config=display_cells(grid, robots), materials=MATERIALS),
+            **grid_stats(grid, robots)}
+
+
+@instrumentation.timed('render')
+def encode_grid(grid, robots=None):
+    """Helper function for the delta protocol, creates a payload with the whole grid as a compact buffer of cell
+    values (column major, one byte per cell). The browser builds the grid from it once."""
+    return {'n_cols': grid.n_cols, 'n_rows': grid.n_rows, 'cells': display_cells(grid, robots).tobytes(),
+            'materials': MATERIALS,
+            **grid_stats(grid, robots)}
+
+
+@instrumentation.timed('render')
+def encode_changes(grid, robots=None):
+    """Helper function for the delta protocol, creates a payload with only the cells changed since the previous
+    payload, as a flat list [x, y, value, x, y, value, ...]."""
+    return {'changes': [i for change in grid.pop_changes() for i in change], **grid_stats(grid, robots)}
+
+
+def grid_file(name):
+    """Returns the path to save a grid under in the grid_configs folder, raises a ValueError for unsafe names."""
+    if not GRID_NAME.fullmatch(name):
+        raise ValueError(f'Invalid grid name {name!r}, use letters, digits, spaces, - and _ only!')
+    return f'{PATH}/grid_configs/{name}{GRID_EXTENSION}'
 
 
 # Routes:
 
 @app.route('/')
 def home():
-    return render_template('home_page.html', files=os.listdir(PATH + '/grid_configs'),
-                           rfiles=[i for i in os.listdir(PATH + '/robot_configs') if '__' not in i])
+    return render_template('home_page.html', files=sorted(f for f in os.listdir(PATH + '/grid_configs')
+                                                   if f.endswith(('.grid', GRID_EXTENSION))),
+                           rfiles=[f'{name}.py' for name in robot_registry.names()],
+                           recordings=list_recordings(RECORDINGS))
 
 
 @app.route('/editor')
@@ -109,49 +155,249 @@ def build_grid():
     for (x, y) in deaths:
         grid.put_singular_death(x, y)
     if to_save and len(name) > 0:
-        pickle.dump(grid, open(f'{PATH}/grid_configs/{name}.grid', 'wb'))
+        try:
+            save_grid(grid, grid_file(name))
+        except ValueError as e:
+            return {'error': str(e)}, 400
         return {'grid': '', 'success': 'true'}
     return draw_grid(grid)
 
 
-@app.route('/get_history')
-def get_history():
-    """Returns a plot of the history."""
-    global robots
-    if robots:
-        fig = Figure()
-        ax = fig.subplots()
-        for robot in robots:
-            ax.plot(np.array(robot.history[0]) + 0.5, -1 * np.array(robot.history[1]) - 0.5)
-            obstacles = [[], []]
-            for x in range(robot.grid.cells.shape[0]):
-                for y in range(robot.grid.cells.shape[1]):
-                    if (robot.grid.cells[x][y] == -2) or (robot.grid.cells[x][y] == -1):
-                        obstacles[0].extend([x, x + 0.5, None])
-                        obstacles[1].extend([-1 * y, -1 * y - 0.5, None])
-            ax.plot(obstacles[0], obstacles[1])
-            ax.get_xaxis().set_visible(False)
-            ax.get_yaxis().set_visible(False)
+@app.route('/build_grid', methods=['POST'])
+def build_grid_bulk():
+    """Builds a grid from all of its cells at once, for the editor. The request is a JSON object with:
+     n_cols, n_rows: size of the grid.
+     encoding: 'rle' or 'base64', see grid_format.decode_cells.
+     cells: the encoded cell values, the border of the grid is always turned into walls.
+     save: boolean to save the grid to a file.
+     name: filename to save the grid to.
+     Answers with the cells of the grid as a base64 buffer (like encode_grid) and its statistics, or an error (400).
+     """
+    payload = request.get_json(silent=True) or {}
+    try:
+        n_cols, n_rows = int(payload['n_cols']), int(payload['n_rows'])
+        if n_cols < 3 or n_rows < 3 or n_cols * n_rows > app.config['MAX_GRID_CELLS']:
+            raise ValueError(f'A grid has to be at least 3 by 3 and at most {app.config["MAX_GRID_CELLS"]} cells!')
+        cells = decode_cells(n_cols, n_rows, payload.get('encoding', 'rle'), payload['cells'])
+        name = str(payload.get('name', ''))
+        path = grid_file(name) if payload.get('save') and len(name) > 0 else None
+    except KeyError as e:
+        return {'error': f'Missing {e}!'}, 400
+    except (TypeError, ValueError) as e:
+        return {'error': str(e)}, 400
+    cells[0, :] = cells[-1, :] = -1
+    cells[:, 0] = cells[:, -1] = -1
+    grid = Grid.from_cells(cells)
+    if path:
+        save_grid(grid, path)
+        return {'success': 'true'}
+    return {**encode_grid(grid), 'cells': base64.b64encode(grid.cells.tobytes()).decode('ascii')}
+
+
+class HistoryPlot:
+    """Plot of the trajectories of the robots on a grid. The obstacle layer is computed once when the plot is
+    created and the figure is reused, rendering only hands the current histories to the trajectory lines."""
+
+    def __init__(self, grid, robots):
+        self.robots = robots
+        self.fig = Figure()
+        ax = self.fig.subplots()
+        # Plot the (integer) history coordinates directly, shifted to the center of the tiles by the transform:
+        transform = Affine2D().scale(1, -1).translate(0.5, -0.5) + ax.transData
+        self.lines = [ax.plot([], [], transform=transform)[0] for robot in robots]
+        ax.plot(*self.obstacle_segments(grid))
+        ax.get_xaxis().set_visible(False)
+        ax.get_yaxis().set_visible(False)
+        self.rendered_at = None
+        self.image = ''
+
+    @staticmethod
+    def obstacle_segments(grid):
+        """Coordinates of a short line segment for every wall and obstacle tile, separated by NaN."""
+        x, y = np.nonzero((grid.cells == -1) | (grid.cells == -2))
+        xs = np.stack([x, x + 0.5, np.full(len(x), np.nan)], axis=1).ravel()
+        ys = np.stack([-1 * y, -1 * y - 0.5, np.full(len(y), np.nan)], axis=1).ravel()
+        return xs, ys
+
+    @instrumentation.timed('plot')
+    def render(self, force=False):
+        """Renders the plot to an html image, returns None if the previous render is less than PLOT_INTERVAL
+        seconds old (unless forced)."""
+        now = time.time()
+        if not force and self.rendered_at is not None and now - self.rendered_at < app.config['PLOT_INTERVAL']:
+            return None
+        for line, robot in zip(self.lines, self.robots):
+            line.set_data(robot.history[0], robot.history[1])
         # Save it to a temporary buffer.
         buf = BytesIO()
-        fig.savefig(buf, format="png")
+        self.fig.savefig(buf, format="png")
         # Embed the result in the html output.
         data = base64.b64encode(buf.getbuffer()).decode("ascii")
-        return f"<img src='data:image/png;base64,{data}'/>"
+        self.image = f"<img src='data:image/png;base64,{data}'/>"
+        self.rendered_at = now
+        return self.image
+
+
+class Simulation:
+    """Simulation state of a single browser session. Epochs are either stepped by the browser ('get_update') or
+    by a background task started with 'start_sim', which runs epochs_per_frame epochs and then pushes one frame to
+    the browser, tick_rate times per second."""
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.grid = None
+        # The robots move simultaneously as a Fleet, robots are the views of its robots for the robot algorithms:
+        self.fleet = None
+        self.robots = None
+        self.history_plot = None
+        # Playback of a recording, instead of a simulation:
+        self.replay = None
+        self.robot_alg = None
+        self.running = False
+        # Incremented every time the loop is (re)started, so an old loop that is still sleeping exits:
+        self.generation = 0
+        self.tick_rate = 2
+        self.epochs_per_frame = 1
+        self.clean_criteria = 100
+        # Held while the simulation is updated, so steps from the browser and the background task don't interleave:
+        self.lock = threading.Lock()
+
+    def emit(self, event, data):
+        with instrumentation.phase('emit'):
+            socketio.emit(event, data, to=self.sid)
+
+    def epoch(self):
+        """Calls the selected robot algorithm once for every robot that is still alive, and then carries out the moves
+        of all robots at once."""
+        try:
+            # The robot epoch method of the selected robot config file, reloaded if the file changed:
+            robot_epoch = robot_registry.robot_epoch(self.robot_alg)
+        except KeyError:
+            # Checking if the selected robot algorithm (still) exists:
+            print(f'[ERROR] make sure the file {self.robot_alg}.py is present in the robot_configs folder.')
+            self.running = False
+            return
+        for robot in self.robots:
+            # Don't update dead robots:
+            if robot.alive:
+                with instrumentation.phase('robot_epoch'):
+                    robot_epoch(robot)
+        with instrumentation.phase('move'):
+            self.fleet.resolve()
+        instrumentation.count('epochs')
+        instrumentation.epoch_done()
+
+    def finished(self):
+        if all(not robot.alive for robot in self.robots):
+            return True
+        return self.grid.stats.clean_percent >= self.clean_criteria and self.grid.stats.goal == 0
+
+    def push_frame(self):
+        instrumentation.count('frames')
+        if self.grid.changes is not None:
+            self.emit('grid_patch', encode_changes(self.grid, self.robots))
+        else:
+            self.emit('new_grid', draw_grid(self.grid, self.robots))
+        # The plot is only rendered every PLOT_INTERVAL seconds:
+        plot = self.history_plot.render() if self.history_plot else None
+        if plot is not None:
+            self.emit('new_plot', plot)
+
+    def run(self, generation):
+        """Background task driving the simulation until it is stopped or finished."""
+        while self.running and generation == self.generation:
+            started = time.time()
+            with self.lock:
+                for i in range(self.epochs_per_frame):
+                    self.epoch()
+                    if self.finished():
+                        self.running = False
+                        break
+                self.push_frame()
+            socketio.sleep(max(0., 1 / self.tick_rate - (time.time() - started)))
+        if generation == self.generation:
+            self.emit('sim_stopped', {})
+
+
+simulations = {}
+
+
+def get_simulation():
+    """Returns the simulation of the browser session that sent the current event."""
+    if request.sid not in simulations:
+        simulations[request.sid] = Simulation(request.sid)
+    return simulations[request.sid]
+
+
+@app.route('/get_history')
+def get_history():
+    """Returns a plot of the history of the simulation of the session given by the 'sid' request parameter."""
+    simulation = simulations.get(request.args.get('sid'))
+    if simulation and simulation.history_plot:
+        return simulation.history_plot.render(force=True)
     return ''
 
 
+@app.route('/metrics')
+def metrics():
+    """Per phase histograms and counters in the Prometheus text format, or as JSON with format=json. enable=1 or
+    enable=0 turns the instrumentation on or off, reset=1 clears the recorded data."""
+    if 'enable' in request.args:
+        if request.args['enable'] == '1':
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+    if request.args.get('reset') == '1':
+        instrumentation.reset()
+    if request.args.get('format') == 'json':
+        return jsonify({'enabled': instrumentation.enabled, **instrumentation.snapshot()})
+    return instrumentation.prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+@app.route('/profile')
+def profile():
+    """With epochs=N, profiles the next N epochs of the simulations (mode=cprofile or mode=sample, start=K to
+    skip K epochs first). Without it, returns the report of the last profile."""
+    if 'epochs' in request.args:
+        try:
+            instrumentation.start_profile(int(request.args['epochs']), start=int(request.args.get('start', 0)),
+                                          mode=request.args.get('mode', 'cprofile'))
+        except ValueError as e:
+            return str(e), 400
+        return 'Profile started.'
+    if instrumentation.profiler is None:
+        return 'No profile started, use /profile?epochs=N.', 404
+    status = 'finished' if instrumentation.profiler.finished else 'running'
+    return f'Profile {status}:\n{instrumentation.profiler.report()}', 200, {'Content-Type': 'text/plain'}
+
+
 # Event handlers:
 
+@socketio.on('disconnect')
+def handle_browser_disconnect(*args):
+    simulation = simulations.pop(request.sid, None)
+    if simulation:
+        simulation.running = False
+
+
 @socketio.on('get_grid')
 def handle_browser_new_grid(json):
     """Handles socket event 'get_grid', needs filename of grid config as payload."""
-    global grid
-    global occupied
-    occupied = False
-    with open(f'{PATH}/grid_configs/{json["data"]}', 'rb') as f:
-        grid = pickle.load(f)
-    emit('new_grid', draw_grid(grid))
+    simulation = get_simulation()
+    with simulation.lock:
+        simulation.running = False
+        simulation.fleet = None
+        simulation.robots = None
+        # The plot of the previous grid is no longer valid:
+        simulation.history_plot = None
+        simulation.replay = None
+        simulation.grid = load_template(f'{PATH}/grid_configs/{json["data"]}').copy()
+        if json.get('delta'):
+            # Send the grid once, after that only the changed cells are sent:
+            simulation.grid.track_changes()
+            emit('grid_buffer', encode_grid(simulation.grid))
+        else:
+            emit('new_grid', draw_grid(simulation.grid))
 
 
 @socketio.on('get_robot')
@@ -165,56 +411,111 @@ def handle_browser_spawn_robot(json):
     lam_drain = float(json['lam_drain'])
     vision = int(json['vision'])
     n_robots = int(json['n_robots'])
-    # Check if selected robot algorithm contains a cheat:
-    with open(PATH + '/robot_configs/' + robot_alg) as f:
-        lines = f.read().split('\n')
-        ERRORS = "\n".join(
-            [f'Illegal access of grid by robot algorithm in line {i + 1}!\n use possible_tiles_after_move() instead!'
-             for i, line in enumerate(lines) if 'grid.cells' in line or 'grid' in line])
+    # Check if selected robot algorithm contains a cheat (only checked again when the file changed):
+    try:
+        ERRORS = "\n".join(robot_registry.validate(robot_alg))
+    except KeyError:
+        ERRORS = f'Robot algorithm {robot_alg} not found!'
     if len(ERRORS) > 0:
         print(f'[ERROR]: {ERRORS}')
         ERRORS = ERRORS.replace('\n', '<br>')
         emit('new_grid', {'grid': f'<h1>{ERRORS}</h1>'})
     else:
-        global robots
-        global grid
-        try:
-            robots = [Robot(grid, (int(x_spawn[i]), int(y_spawn[i])), orientation=orient, battery_drain_p=p_drain,
-                            battery_drain_lam=lam_drain, p_move=p_determ, vision=vision) for i in range(n_robots)]
-        except IndexError:
-            emit('new_grid', {'grid': '<h1>Invalid robot coordinates entered!</h1>'})
-            print('[ERROR] invalid starting coordinate entered!')
-        except ValueError:
-            emit('new_grid', {'grid': '<h1>Invalid robot coordinates entered, spot on map is not free!</h1>'})
-            print('[ERROR] invalid starting coordinate entered, spot on map is not free!')
-        else:
-            emit('new_grid', draw_grid(grid))
+        simulation = get_simulation()
+        with simulation.lock:
+            grid = simulation.grid
+            if simulation.fleet is not None:
+                simulation.fleet.release()
+                simulation.fleet = simulation.robots = None
+            try:
+                fleet = Fleet(grid, [(int(x_spawn[i]), int(y_spawn[i])) for i in range(n_robots)],
+                              orientation=orient, battery_drain_p=p_drain, battery_drain_lam=lam_drain,
+                              p_move=p_determ, vision=vision)
+            except IndexError:
+                emit('new_grid', {'grid': '<h1>Invalid robot coordinates entered!</h1>'})
+                print('[ERROR] invalid starting coordinate entered!')
+            except ValueError:
+                emit('new_grid', {'grid': '<h1>Invalid robot coordinates entered, spot on map is not free!</h1>'})
+                print('[ERROR] invalid starting coordinate entered, spot on map is not free!')
+            else:
+                simulation.fleet = fleet
+                simulation.robots = robots = fleet.views
+                simulation.robot_alg = robot_alg.split('.py')[0]
+                simulation.history_plot = HistoryPlot(grid, robots)
+                if grid.changes is not None:
+                    emit('grid_patch', encode_changes(grid, robots))
+                else:
+                    emit('new_grid', draw_grid(grid, robots))
 
 
 @socketio.on('get_update')
 def handle_browser_update(json):
-    global robots
-    global occupied
-    global grid
-    robot_alg = json['robot_file'].split('.py')[0]
-    if not occupied:
-        occupied = True
-        # Checking if the selected robot algorithm is indeed imported, if file changed since starting app.py,
-        # throw error.
-        try:
-            for robot in robots:
-                # Don't update dead robots:
-                if robot.alive:
-                    # Call the robot epoch method of the selected robot config file:
-                    globals()[robot_alg].robot_epoch(robot)
-        except KeyError:
-            print(
-                f'[ERROR] restart app.py and make sure the file {robot_alg}.py is present in the robot_configs folder.')
-        emit('new_grid', draw_grid(grid))
-        emit('new_plot', get_history())
-        occupied = False
-    else:
-        pass
+    """Handles socket event 'get_update', steps the simulation a single epoch."""
+    simulation = get_simulation()
+    if simulation.robots and not simulation.running:
+        with simulation.lock:
+            simulation.robot_alg = json['robot_file'].split('.py')[0]
+            simulation.epoch()
+            simulation.push_frame()
+
+
+@socketio.on('start_sim')
+def handle_browser_start_simulation(json):
+    """Handles socket event 'start_sim', starts (or changes the speed of) the simulation loop on the server.
+    Payload: robot_file, tick_rate (frames per second), epochs_per_frame and clean_criteria (%)."""
+    simulation = get_simulation()
+    if not simulation.robots:
+        return
+    with simulation.lock:
+        simulation.robot_alg = json['robot_file'].split('.py')[0]
+        simulation.tick_rate = float(json.get('tick_rate', simulation.tick_rate))
+        simulation.epochs_per_frame = max(1, int(json.get('epochs_per_frame', simulation.epochs_per_frame)))
+        simulation.clean_criteria = float(json.get('clean_criteria', simulation.clean_criteria))
+        if simulation.running:
+            return
+        simulation.running = True
+        simulation.generation += 1
+    socketio.start_background_task(simulation.run, simulation.generation)
+
+
+@socketio.on('stop_sim')
+def handle_browser_stop_simulation():
+    simulation = get_simulation()
+    simulation.running = False
+
+
+@socketio.on('get_replay')
+def handle_browser_get_replay(json):
+    """Handles socket event 'get_replay', needs the path of a recording in the recordings folder as payload. Sends the
+    grid at the start of the recording and the number of epochs in it."""
+    if json['data'] not in list_recordings(RECORDINGS):
+        emit('new_grid', {'grid': f'<h1>Recording {json["data"]} not found!</h1>'})
+        return
+    try:
+        replay = Replay(f'{RECORDINGS}/{json["data"]}')
+    except ValueError as e:
+        emit('new_grid', {'grid': f'<h1>{e}</h1>'})
+        return
+    simulation = get_simulation()
+    with simulation.lock:
+        simulation.running = False
+        simulation.grid = simulation.fleet = simulation.robots = simulation.history_plot = None
+        simulation.replay = replay
+    emit('grid_buffer', encode_grid(replay.grid, replay.robots))
+    emit('replay_info', {'n_epochs': replay.recording.n_epochs, 'meta': replay.recording.meta})
+
+
+@socketio.on('replay_seek')
+def handle_browser_replay_seek(json):
+    """Handles socket event 'replay_seek', moves the replay to the epoch in the payload and sends the cells that
+    changed."""
+    simulation = get_simulation()
+    replay = simulation.replay
+    if replay is None:
+        return
+    with simulation.lock:
+        replay.seek(int(json['epoch']))
+        emit('replay_frame', {'epoch': replay.epoch, **encode_changes(replay.grid, replay.robots)})
 
 
 if __name__ == '__main__':
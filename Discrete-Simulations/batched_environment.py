@@ -0,0 +1,201 @@
+import argparse
+
+import numpy as np
+
+# Orientations are stored as indices into these tables, in the same order as Robot.orients/Robot.dirs:
+ORIENTATIONS = ['n', 'e', 's', 'w']
+DIRS = np.array([(0, -1), (1, 0), (0, 1), (-1, 0)])
+ORIENT_CODES = np.array([-3, -4, -5, -6])
+
+
+class BatchedGrid:
+    """B copies of a grid, stacked into a single (B, n_cols, n_rows) array so that many episodes can be
+    simulated in lockstep."""
+
+    def __init__(self, grid, n_envs):
+        self.n_envs = n_envs
+        self.n_cols = grid.n_cols
+        self.n_rows = grid.n_rows
+        self.cells = np.repeat(grid.cells[np.newaxis], n_envs, axis=0)
+        # Running tile counts per episode, kept up to date by BatchedRobot.move:
+        self.n_clean = (self.cells == 0).sum(axis=(1, 2))
+        self.n_dirty = (self.cells >= 1).sum(axis=(1, 2))
+        self.n_goal = (self.cells == 2).sum(axis=(1, 2))
+        self.n_visitable = (self.cells >= 0).sum(axis=(1, 2))
+
+    def clean_percent(self):
+        return 100 * self.n_clean / (self.n_clean + self.n_dirty)
+
+
+class BatchedRobot:
+    """One robot per episode of a BatchedGrid. Mirrors the Robot interface, but every attribute is an array over
+    the episodes and every method acts on all (selected) episodes at once."""
+
+    def __init__(self, grid, pos, orientation, p_move=0, battery_drain_p=0, battery_drain_lam=0, vision=1, rng=None):
+        self.grid = grid
+        # Generator for all random numbers of the robots (rng can also be a seed):
+        self.rng = np.random.default_rng(rng)
+        self.envs = np.arange(grid.n_envs)
+        self.pos = np.tile(np.asarray(pos), (grid.n_envs, 1))
+        if (grid.cells[self.envs, self.pos[:, 0], self.pos[:, 1]] != 1).any():
+            raise ValueError
+        self.orientation = np.full(grid.n_envs, ORIENTATIONS.index(orientation))
+        grid.cells[self.envs, self.pos[:, 0], self.pos[:, 1]] = ORIENT_CODES[self.orientation]
+        # The (dirty) spawn tiles are occupied now, like the tile of a Robot they count as neither clean nor dirty:
+        grid.n_dirty[self.envs] -= 1
+        self.p_move = p_move
+        self.battery_drain_p = battery_drain_p
+        self.battery_drain_lam = battery_drain_lam
+        self.battery_lvl = np.full(grid.n_envs, 100.)
+        self.alive = np.ones(grid.n_envs, dtype=bool)
+        # Episodes that are finished (clean, or stopped by the caller) are no longer updated:
+        self.active = np.ones(grid.n_envs, dtype=bool)
+        self.vision = vision
+        # Statistics needed for the efficiency score:
+        self.n_moves = np.zeros(grid.n_envs, dtype=int)
+        self.n_revisited = np.zeros(grid.n_envs, dtype=int)
+        self.visited = np.zeros(grid.cells.shape, dtype=bool)
+        # Sensor offsets, shaped (4, vision) like the observation:
+        steps = np.arange(1, vision + 1)
+        self._dx = DIRS[:, 0, np.newaxis] * steps
+        self._dy = DIRS[:, 1, np.newaxis] * steps
+
+    def _selected(self, mask):
+        selected = self.alive & self.active
+        if mask is not None:
+            selected &= mask
+        return selected
+
+    def possible_tiles_after_move(self):
+        """Returns the (B, 4, vision) tile values the robots can see in directions n, e, s, w and a mask telling
+        which of them are inside the grid. Tiles outside the grid read as walls, death tiles read as dirty."""
+        xs = self.pos[:, 0, np.newaxis, np.newaxis] + self._dx
+        ys = self.pos[:, 1, np.newaxis, np.newaxis] + self._dy
+        valid = (xs >= 0) & (xs < self.grid.n_cols) & (ys >= 0) & (ys < self.grid.n_rows)
+        tiles = self.grid.cells[self.envs[:, np.newaxis, np.newaxis], np.clip(xs, 0, self.grid.n_cols - 1),
+                                np.clip(ys, 0, self.grid.n_rows - 1)]
+        tiles = np.where(tiles == 3, 1, tiles)
+        tiles[~valid] = -1
+        return tiles, valid
+
+    def move(self, mask=None):
+        """Moves the selected robots one tile forward (or to a random free tile with probability p_move).
+        Returns a boolean array telling which robots moved and survived."""
+        moving = self._selected(mask)
+        random_move = self.rng.binomial(1, self.p_move, self.grid.n_envs).astype(bool)
+        do_battery_drain = self.rng.binomial(1, self.battery_drain_p, self.grid.n_envs).astype(bool)
+        do_battery_drain &= moving & (self.battery_lvl > 0)
+        self.battery_lvl[do_battery_drain] -= self.rng.exponential(self.battery_drain_lam, do_battery_drain.sum())
+        # Handle empty batteries:
+        empty = moving & (self.battery_lvl <= 0)
+        self.alive[empty] = False
+        moving &= ~empty
+        # Pick the direction of every robot, random moves go to one of the free neighbouring tiles:
+        direction = self.orientation.copy()
+        if random_move.any():
+            neighbours = self.grid.cells[self.envs[:, np.newaxis], self.pos[:, 0, np.newaxis] + DIRS[:, 0],
+                                         self.pos[:, 1, np.newaxis] + DIRS[:, 1]]
+            free = neighbours >= 0
+            keys = np.where(free, self.rng.random(free.shape), -1)
+            direction = np.where(random_move, keys.argmax(axis=1), direction)
+            moving &= ~random_move | free.any(axis=1)
+        new_pos = self.pos + DIRS[direction]
+        tile_after_move = self.grid.cells[self.envs, new_pos[:, 0], new_pos[:, 1]]
+        # Only move to non-blocked tiles:
+        moving &= tile_after_move >= 0
+        envs = self.envs[moving]
+        old_x, old_y = self.pos[moving, 0], self.pos[moving, 1]
+        new_x, new_y = new_pos[moving, 0], new_pos[moving, 1]
+        tile_after_move = tile_after_move[moving]
+        self.grid.cells[envs, old_x, old_y] = 0
+        self.grid.cells[envs, new_x, new_y] = ORIENT_CODES[direction[moving]]
+        self.pos[moving] = new_pos[moving]
+        # Update the tile counts, the tile we left is clean and the tile we entered is occupied:
+        self.grid.n_clean[envs] += 1 - (tile_after_move == 0)
+        self.grid.n_dirty[envs] -= tile_after_move >= 1
+        self.grid.n_goal[envs] -= tile_after_move == 2
+        # Update the efficiency statistics:
+        self.n_moves[envs] += 1
+        self.n_revisited[envs] += self.visited[envs, new_x, new_y]
+        self.visited[envs, new_x, new_y] = True
+        # Death:
+        died = np.zeros(self.grid.n_envs, dtype=bool)
+        died[envs] = tile_after_move == 3
+        self.alive[died] = False
+        return moving & ~died
+
+    def rotate(self, dir, mask=None):
+        """Rotates the selected robots, dir is either 'r', 'l' or an array with the number of clockwise quarter
+        turns for every robot (negative for counter clockwise)."""
+        rotating = self._selected(mask)
+        if isinstance(dir, str):
+            turns = 1 if dir == 'r' else -1
+        else:
+            turns = np.broadcast_to(dir, rotating.shape)[rotating]
+        self.orientation[rotating] = (self.orientation[rotating] + turns) % 4
+        self.grid.cells[self.envs[rotating], self.pos[rotating, 0], self.pos[rotating, 1]] = ORIENT_CODES[
+            self.orientation[rotating]]
+
+    def efficiency(self):
+        return (100 * self.grid.n_visitable) / (self.grid.n_visitable + self.n_revisited)
+
+
+def run_batched(grid, n_envs, robot_epoch, stopping_criteria=100, max_epochs=None, **robot_kwargs):
+    """Runs n_envs episodes of a batched robot algorithm on copies of grid in lockstep, returns a dict with the
+    final statistics of every episode. robot_kwargs are passed to BatchedRobot (pos, orientation, p_move, ...)."""
+    batched_grid = BatchedGrid(grid, n_envs)
+    robot = BatchedRobot(batched_grid, **robot_kwargs)
+    n_epochs = np.zeros(n_envs, dtype=int)
+    while robot.active.any() and (max_epochs is None or n_epochs.max() < max_epochs):
+        n_epochs[robot.active] += 1
+        # Do a robot epoch for all running episodes:
+        robot_epoch(robot)
+        # Stop the episodes where the robot died or the room can be considered clean:
+        done = ~robot.alive | ((batched_grid.clean_percent() >= stopping_criteria) & (batched_grid.n_goal == 0))
+        robot.active &= ~done
+    return {'efficiency': robot.efficiency(), 'n_moves': robot.n_moves, 'cleaned': batched_grid.clean_percent(),
+            'died': ~robot.alive, 'n_epochs': n_epochs}
+
+
+def check_termination(grid_file, n_envs=8, seed=0, max_epochs=10000, **robot_params):
+    """Runs the greedy random robot on grid_file with both the batched and the scalar (headless) environment, and
+    checks that the tile counts agree after spawning and that the episodes end the same way. Without slips, battery
+    drain and death tiles every episode has to end with a clean room. Returns a list of the differences found."""
+    from environment import Robot
+    from grid_format import load_template
+    from headless import run_episode
+    from robot_configs.greedy_random_robot import robot_epoch_batched
+
+    template = load_template(f'grid_configs/{grid_file}')
+    problems = []
+    batched_grid = BatchedGrid(template, n_envs)
+    BatchedRobot(batched_grid, (1, 1), 'n', **robot_params)
+    grid = template.copy()
+    Robot(grid, (1, 1), 'n')
+    for name, count in (('clean', batched_grid.n_clean), ('dirty', batched_grid.n_dirty),
+                        ('goal', batched_grid.n_goal), ('visitable', batched_grid.n_visitable)):
+        if (count != getattr(grid.stats, name)).any():
+            problems.append(f'{name} tiles after spawning: batched {count.tolist()}, scalar {getattr(grid.stats, name)}')
+    batched = run_batched(template, n_envs, robot_epoch_batched, max_epochs=max_epochs, pos=(1, 1), orientation='n',
+                          rng=seed, **robot_params)
+    scalar = [run_episode(episode, seed + episode, grid_file=grid_file, robot_params=robot_params)
+              for episode in range(n_envs)]
+    if (batched['n_epochs'] >= max_epochs).any():
+        problems.append(f'batched episodes did not end within {max_epochs} epochs: {batched["n_epochs"].tolist()}')
+    for name in ('cleaned', 'died'):
+        batched_values = sorted(set(np.round(batched[name].astype(float), 2).tolist()))
+        scalar_values = sorted(set(round(float(result[name]), 2) for result in scalar))
+        if batched_values != scalar_values:
+            problems.append(f'{name}: batched {batched_values}, scalar {scalar_values}')
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the batched and the scalar environment agree.')
+    parser.add_argument('grids', nargs='*', default=['snake.grid'],
+                        help='grid files in the grid_configs folder')
+    parser.add_argument('--episodes', type=int, default=8)
+    args = parser.parse_args()
+    for grid_file in args.grids:
+        problems = check_termination(grid_file, args.episodes)
+        print(f'{grid_file}: ' + ('ok' if not problems else '\n    '.join(['differences:'] + problems)))
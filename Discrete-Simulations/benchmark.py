@@ -0,0 +1,284 @@
+"""Benchmark suite for the hot paths of the simulations.
+
+Every case times a single operation (a robot move, a robot epoch, a render, a whole episode, ...) on a grid from the
+grid_configs folder or a generated grid of increasing size, and reports operations per second. Results are written
+as JSON, and can be compared with a stored baseline, in which case the exit status is 1 if any case got slower than
+the threshold:
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.2
+    python benchmark.py --filter robot_epoch --sizes 64 1024
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from environment import Robot
+from grid_format import load_template
+from grid_generator import generate
+
+CONTINUOUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Continuous-Simulations')
+
+
+def time_op(op, min_time=0.2, repeat=5):
+    """Times op, calling it in batches that take at least min_time / repeat seconds. Returns the best and the median
+    time per call over repeat batches, and the number of calls per batch."""
+    n = 1
+    while True:
+        started = time.perf_counter()
+        for i in range(n):
+            op()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / repeat:
+            break
+        n *= 2 if elapsed == 0 else max(2, min(10, int(min_time / repeat / elapsed) + 1))
+    times = []
+    for k in range(repeat):
+        started = time.perf_counter()
+        for i in range(n):
+            op()
+        times.append((time.perf_counter() - started) / n)
+    return min(times), statistics.median(times), n
+
+
+def spawn_robot(grid, **robot_params):
+    """A robot on the first dirty tile of the grid."""
+    x, y = np.argwhere(grid.cells == 1)[0]
+    return Robot(grid, (int(x), int(y)), 'n', **robot_params)
+
+
+def grids(args):
+    """(name, template grid) pairs: the bundled grid files and a generated house for every size."""
+    for path in sorted(glob.glob('grid_configs/*.grid')):
+        yield os.path.basename(path), load_template(path)
+    for size in args.sizes:
+        yield f'house-{size}', generate('house', size, size, seed=0, n_rooms=max(1, size // 8))
+
+
+# Cases, every case function yields (name, params, setup) with setup() returning the operation to time:
+
+def move_cases(args):
+    for grid_name, template in grids(args):
+        def setup(template=template):
+            robot = spawn_robot(template.copy())
+
+            def op():
+                if not robot.move():
+                    robot.rotate('r')
+            return op
+        yield 'robot.move', {'grid': grid_name}, setup
+
+
+def sensor_cases(args):
+    for grid_name, template in grids(args):
+        for vision in args.vision:
+            def setup(template=template, vision=vision):
+                return spawn_robot(template.copy(), vision=vision).possible_tiles_after_move
+            yield 'possible_tiles_after_move', {'grid': grid_name, 'vision': vision}, setup
+
+
+def epoch_cases(args):
+    from robot_configs.greedy_random_robot import robot_epoch
+    for grid_name, template in grids(args):
+        for n_robots in args.robots:
+            if n_robots > np.count_nonzero(template.cells == 1):
+                continue
+
+            def setup(template=template, n_robots=n_robots):
+                grid = template.copy()
+                robots = []
+                random.seed(0)
+                np.random.seed(0)
+
+                def op():
+                    # The robots need a drain to die, robot_epoch never returns for a robot that is boxed in. When
+                    # all of them died, the episode starts over on a fresh copy of the grid:
+                    if not any(robot.alive for robot in robots):
+                        template.copy(out=grid)
+                        robots[:] = [spawn_robot(grid, battery_drain_p=0.5, battery_drain_lam=2)
+                                     for i in range(n_robots)]
+                    for robot in robots:
+                        if robot.alive:
+                            robot_epoch(robot)
+                return op
+            yield 'robot_epoch', {'grid': grid_name, 'n_robots': n_robots, 'algorithm': 'greedy_random_robot'}, setup
+
+
+def fleet_cases(args):
+    from fleet_environment import Fleet
+    from robot_configs.greedy_random_robot import robot_epoch
+    for grid_name, template in grids(args):
+        for n_robots in args.fleet:
+            if n_robots > np.count_nonzero(template.cells == 1):
+                continue
+
+            def setup(template=template, n_robots=n_robots):
+                grid = template.copy()
+                fleets = []
+
+                def op():
+                    # Like robot_epoch, the episode starts over on a fresh copy of the grid when all robots died:
+                    if not fleets or not fleets[0].alive.any():
+                        template.copy(out=grid)
+                        positions = np.argwhere(grid.cells == 1)[:n_robots]
+                        fleets[:] = [Fleet(grid, positions, battery_drain_p=0.5, battery_drain_lam=2, rng=0)]
+                    fleets[0].tick(robot_epoch)
+                return op
+            yield 'fleet.tick', {'grid': grid_name, 'n_robots': n_robots, 'algorithm': 'greedy_random_robot'}, setup
+
+
+def episode_cases(args):
+    from headless import run_episode
+    for path in sorted(glob.glob('grid_configs/*.grid')):
+        def setup(grid_file=os.path.basename(path)):
+            seeds = iter(range(sys.maxsize))
+
+            def op():
+                run_episode(0, next(seeds), grid_file=grid_file,
+                            robot_params={'battery_drain_p': 0.5, 'battery_drain_lam': 2})
+            return op
+        yield 'episode', {'grid': os.path.basename(path), 'algorithm': 'greedy_random_robot'}, setup
+
+
+def app_cases(args):
+    import app
+    for grid_name, template in grids(args):
+        # Rendering the whole grid as html takes seconds for the largest grids:
+        if template.cells.size > args.max_render_size ** 2:
+            continue
+        def setup_draw(template=template):
+            grid = template.copy()
+            robots = [spawn_robot(grid)]
+
+            def op():
+                # render_template needs an app context, entered per call so none is left behind after the case (a
+                # test request context costs ~0.4 ms, an app context a few us):
+                with app.app.app_context():
+                    return app.draw_grid(grid, robots)
+            return op
+        yield 'app.draw_grid', {'grid': grid_name}, setup_draw
+
+        def setup_history(template=template):
+            grid = template.copy()
+            simulation = app.Simulation('benchmark')
+            simulation.grid, simulation.robots = grid, [spawn_robot(grid)]
+            # A trajectory of a few hundred moves:
+            for i in range(300):
+                if not simulation.robots[0].move():
+                    simulation.robots[0].rotate('r')
+            simulation.history_plot = app.HistoryPlot(grid, simulation.robots)
+            app.simulations['benchmark'] = simulation
+            client = app.app.test_client()
+            return lambda: client.get('/get_history?sid=benchmark')
+        yield 'app.get_history', {'grid': grid_name}, setup_history
+
+
+def continuous_cases(args):
+    if CONTINUOUS_PATH not in sys.path:
+        sys.path.insert(0, CONTINUOUS_PATH)
+    from continuous import Grid as ContinuousGrid, Robot as ContinuousRobot
+    for n_obstacles in args.obstacles:
+        def setup(n_obstacles=n_obstacles):
+            rng = random.Random(0)
+            # Constant obstacle density of 0.1 per unit of area:
+            size = (n_obstacles / 0.1) ** 0.5
+            grid = ContinuousGrid(size + 2, size + 2)
+            for i in range(n_obstacles):
+                grid.put_obstacle(rng.uniform(2, size), rng.uniform(2, size), rng.uniform(0.2, 1), rng.uniform(0.2, 1))
+            grid.spawn_robots([ContinuousRobot(id=1)], [(0, 0)])
+            robot = grid.robots[0]
+            positions = [(rng.uniform(0, size), rng.uniform(0, size)) for i in range(1000)]
+            boxes = itertools.cycle(positions)
+
+            def op():
+                robot.bounding_box.update_pos(*next(boxes))
+                return grid.is_blocked(robot)
+            return op
+        yield 'continuous.is_blocked', {'n_obstacles': n_obstacles}, setup
+
+
+CASES = [move_cases, sensor_cases, epoch_cases, fleet_cases, episode_cases, app_cases, continuous_cases]
+
+
+def case_key(name, params):
+    return name + '[' + ','.join(f'{key}={value}' for key, value in params.items()) + ']'
+
+
+def run(args):
+    results = {}
+    for cases in CASES:
+        for name, params, setup in cases(args):
+            key = case_key(name, params)
+            if args.filter and not re.search(args.filter, key):
+                continue
+            best, median, n = time_op(setup(), args.min_time, args.repeat)
+            results[key] = {'name': name, 'params': params, 'seconds_per_op': best, 'median_seconds_per_op': median,
+                            'ops_per_second': 1 / best, 'calls_per_batch': n}
+            print(f'{key:<88} {best * 1e6:>12.2f} us {1 / best:>12.0f} /s')
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the speed of every case relative to the baseline, returns the keys of the cases that got slower than
+    threshold (e.g. 0.2 for 20% slower)."""
+    regressions = []
+    print(f"\n{'case':<88} {'baseline (us)':>14} {'now (us)':>10} {'change':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, now = baseline[key]['seconds_per_op'], result['seconds_per_op']
+        change = now / before - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f'{key:<88} {before * 1e6:>14.2f} {now * 1e6:>10.2f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot paths of the simulations.')
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown that counts as a regression in compare mode')
+    parser.add_argument('--filter', default=None, help='only run the cases matching this regular expression')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[16, 64, 256, 1024],
+                        help='sizes of the generated grids')
+    parser.add_argument('--max-render-size', type=int, default=256,
+                        help='largest generated grid size to run the app (rendering) cases on')
+    parser.add_argument('--vision', type=int, nargs='+', default=[1, 3, 10])
+    parser.add_argument('--robots', type=int, nargs='+', default=[1, 4, 16], help='numbers of robots per grid')
+    parser.add_argument('--fleet', type=int, nargs='+', default=[16, 128], help='numbers of robots per fleet')
+    parser.add_argument('--obstacles', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='numbers of obstacles in the continuous cases')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to spend timing every case')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                       'processor': platform.processor(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) got more than {args.threshold:.0%} slower.')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
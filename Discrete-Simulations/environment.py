@@ -1,9 +1,135 @@
 import numpy as np
-import random
+
+# Lookup tables for the tile counts, indexed by cell value + 6 (cell values range from -6 to 3):
+CLEAN_TILES = (0, 0, 0, 0, 0, 0, 1, 0, 0, 0)
+DIRTY_TILES = (0, 0, 0, 0, 0, 0, 0, 1, 1, 1)
+GOAL_TILES = (0, 0, 0, 0, 0, 0, 0, 0, 1, 0)
+# Everything except walls (-1) and obstacles (-2) can be visited, including the tiles robots are standing on:
+VISITABLE_TILES = (1, 1, 1, 1, 0, 0, 1, 1, 1, 1)
+
+# Orientations and the matching moves, in the order the robot senses them:
+ORIENTATIONS = ('n', 'e', 's', 'w')
+DIRECTIONS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+_sensor_offsets = {}
+
+
+def sensor_offsets(vision):
+    """Returns the offsets a robot with the given vision can see, for every distance 1..vision in the directions
+    n, e, s, w (in that order). The table is only built once per vision radius."""
+    if vision not in _sensor_offsets:
+        _sensor_offsets[vision] = tuple((dx * i, dy * i) for i in range(1, vision + 1) for (dx, dy) in DIRECTIONS)
+    return _sensor_offsets[vision]
+
+
+class GridStats:
+    """Running counts of the clean, dirty (including goal and death) and goal tiles of a grid and the number of
+    visitable tiles. Kept up to date by Grid in O(1) for every changed cell."""
+
+    def __init__(self, clean=0, dirty=0, goal=0, visitable=0):
+        self.clean = clean
+        self.dirty = dirty
+        self.goal = goal
+        self.visitable = visitable
+
+    @property
+    def clean_percent(self):
+        return (self.clean / (self.dirty + self.clean)) * 100
+
+    def update(self, old_value, new_value):
+        old_value, new_value = int(old_value) + 6, int(new_value) + 6
+        self.clean += CLEAN_TILES[new_value] - CLEAN_TILES[old_value]
+        self.dirty += DIRTY_TILES[new_value] - DIRTY_TILES[old_value]
+        self.goal += GOAL_TILES[new_value] - GOAL_TILES[old_value]
+        self.visitable += VISITABLE_TILES[new_value] - VISITABLE_TILES[old_value]
+
+    def add_cells(self, cells, sign=1):
+        """Adds (or with sign=-1 removes) the counts of a whole block of cells."""
+        counts = np.bincount(np.asarray(cells, dtype=int).ravel() + 6, minlength=10)
+        self.clean += sign * int(counts @ CLEAN_TILES)
+        self.dirty += sign * int(counts @ DIRTY_TILES)
+        self.goal += sign * int(counts @ GOAL_TILES)
+        self.visitable += sign * int(counts @ VISITABLE_TILES)
+
+
+class Trajectory:
+    """Array backed history of the positions of a robot. The x and y coordinates are kept in separate preallocated
+    arrays that double in size when full, so appending is amortized O(1). trajectory[0] and trajectory[1] give the
+    x and y coordinates (as views), like the [[x, ...], [y, ...]] lists that were used before."""
+
+    def __init__(self, dtype=np.int16, capacity=64):
+        self.x = np.empty(capacity, dtype=dtype)
+        self.y = np.empty(capacity, dtype=dtype)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return (self.x, self.y)[i][:self.length]
+
+    def append(self, x, y):
+        if self.length == len(self.x):
+            self.x = np.concatenate((self.x, np.empty_like(self.x)))
+            self.y = np.concatenate((self.y, np.empty_like(self.y)))
+        self.x[self.length] = x
+        self.y[self.length] = y
+        self.length += 1
+
+
+class RobotStats:
+    """Running counts of the moves of a robot and the number of those moves that went to an already visited tile."""
+
+    def __init__(self):
+        self.n_moves = 0
+        self.n_revisited = 0
+
+
+class RandomStream:
+    """Random numbers for a single robot, from its own numpy Generator. Uniform and exponential samples are drawn
+    in blocks of block_size and handed out one by one, which makes a draw about as cheap as a list lookup.
+    seed can be anything np.random.default_rng accepts (an int, a SeedSequence, ...), the same seed gives the same
+    stream and spawn() splits off independent streams, e.g. one per robot of an episode."""
+
+    def __init__(self, seed=None, block_size=1024):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._uniform = []
+        self._exponential = []
+
+    def spawn(self, n):
+        """n independent child streams."""
+        return [RandomStream(child, self.block_size) for child in self.seed_sequence.spawn(n)]
+
+    def uniform(self):
+        """A float in [0, 1)."""
+        if not self._uniform:
+            # Reversed, so the block is handed out in order by popping from the end:
+            self._uniform = self.rng.random(self.block_size).tolist()[::-1]
+        return self._uniform.pop()
+
+    def bernoulli(self, p):
+        """True with probability p, nothing is drawn for p <= 0."""
+        return p > 0 and self.uniform() < p
+
+    def exponential(self, scale=1.0):
+        if not self._exponential:
+            self._exponential = self.rng.standard_exponential(self.block_size).tolist()[::-1]
+        return self._exponential.pop() * scale
+
+    def randrange(self, start, stop):
+        """Like random.randrange(start, stop)."""
+        return start + int(self.uniform() * (stop - start))
+
+    def choice(self, sequence):
+        """Like random.choice(sequence)."""
+        return sequence[int(self.uniform() * len(sequence))]
 
 
 class Robot:
-    def __init__(self, grid, pos, orientation, p_move=0, battery_drain_p=0, battery_drain_lam=0, vision=1):
+    def __init__(self, grid, pos, orientation, p_move=0, battery_drain_p=0, battery_drain_lam=0, vision=1, rng=None):
         if grid.cells[pos[0], pos[1]] != 1:
             raise ValueError
         self.orientation = orientation
@@ -11,78 +137,115 @@ class Robot:
         self.grid = grid
         self.orients = {'n': -3, 'e': -4, 's': -5, 'w': -6}
         self.dirs = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
-        self.grid.cells[pos] = self.orients[self.orientation]
-        self.history = [[], []]
+        self.grid.set_cell(pos, self.orients[self.orientation])
+        # Coordinates only need 16 bits, unless the grid is huge:
+        self.history = Trajectory(np.int16 if max(grid.cells.shape) <= np.iinfo(np.int16).max else np.int32)
+        self.stats = RobotStats()
+        # Number of times the robot moved onto every tile:
+        self.visits = np.zeros(grid.cells.shape, dtype=np.int32)
         self.p_move = p_move
         self.battery_drain_p = battery_drain_p
         self.battery_drain_lam = battery_drain_lam
         self.battery_lvl = 100
         self.alive = True
         self.vision = vision
+        # Random numbers for the slips and the battery drain, see RandomStream (rng can also be a seed):
+        self.random = rng if isinstance(rng, RandomStream) else RandomStream(rng)
+        # Buffers for observe():
+        self._observation = np.empty((4, vision), dtype=grid.cells.dtype)
+        self._observation_valid = np.empty((4, vision), dtype=bool)
+
+    @property
+    def efficiency(self):
+        n_total_tiles = self.grid.stats.visitable
+        return (100 * n_total_tiles) / (n_total_tiles + self.stats.n_revisited)
+
+    def _record_move(self):
+        self.history.append(*self.pos)
+        self.stats.n_moves += 1
+        visits = self.visits.item(self.pos) + 1
+        self.visits[self.pos] = visits
+        if visits > 1:
+            self.stats.n_revisited += 1
+
+    def floor_plan(self):
+        """A copy of the cells of the room, for planners that are handed the map of the room. Like in
+        possible_tiles_after_move, death tiles are shown as dirty."""
+        cells = self.grid.cells
+        return np.where(cells == 3, 1, cells)
 
     def possible_tiles_after_move(self):
-        moves = list(self.dirs.values())
-        # Fool the robot and show a death tile as normal (dirty)
+        cells = self.grid.cells
+        n_cols, n_rows = cells.shape
+        x, y = self.pos
         data = {}
-        for i in range(self.vision):
-            for move in moves:
-                to_check = tuple(np.array(self.pos) + (np.array(move) * (i + 1)))
-                if to_check[0] < self.grid.cells.shape[0] and to_check[1] < self.grid.cells.shape[1] and to_check[
-                    0] >= 0 and to_check[1] >= 0:
-                    data[tuple(np.array(move) * (i + 1))] = self.grid.cells[to_check]
-                    # Show death tiles as dirty:
-                    if data[tuple(np.array(move) * (i + 1))] == 3:
-                        data[tuple(np.array(move) * (i + 1))] = 1
+        for move in sensor_offsets(self.vision):
+            to_x, to_y = x + move[0], y + move[1]
+            if 0 <= to_x < n_cols and 0 <= to_y < n_rows:
+                tile = cells.item(to_x, to_y)
+                # Fool the robot and show a death tile as normal (dirty):
+                data[move] = 1 if tile == 3 else tile
         return data
 
+    def observe(self):
+        """Array version of possible_tiles_after_move. Returns a (4, vision) array with the tiles at distance
+        1..vision in the directions n, e, s, w (death tiles shown as dirty, tiles outside the grid as walls) and a
+        boolean mask of the entries that lie inside the grid.
+        Both arrays are reused by the next call, copy them if you want to keep them."""
+        cells = self.grid.cells
+        n_cols, n_rows = cells.shape
+        x, y = self.pos
+        observation, valid = self._observation, self._observation_valid
+        for k, move in enumerate(sensor_offsets(self.vision)):
+            to_x, to_y = x + move[0], y + move[1]
+            if 0 <= to_x < n_cols and 0 <= to_y < n_rows:
+                tile = cells.item(to_x, to_y)
+                observation[k % 4, k // 4] = 1 if tile == 3 else tile
+                valid[k % 4, k // 4] = True
+            else:
+                observation[k % 4, k // 4] = -1
+                valid[k % 4, k // 4] = False
+        return observation, valid
+
     def move(self):
         # Can't move if we're dead now, can we?
         if not self.alive:
             return False
-        random_move = np.random.binomial(1, self.p_move)
-        do_battery_drain = np.random.binomial(1, self.battery_drain_p)
-        if do_battery_drain == 1 and self.battery_lvl > 0:
-            self.battery_lvl -= np.random.exponential(self.battery_drain_lam)
+        random_move = self.random.bernoulli(self.p_move)
+        do_battery_drain = self.random.bernoulli(self.battery_drain_p)
+        if do_battery_drain and self.battery_lvl > 0:
+            self.battery_lvl -= self.random.exponential(self.battery_drain_lam)
         # Handle empty battery:
         if self.battery_lvl <= 0:
             self.alive = False
             return False
-        if random_move == 1:
-            moves = self.possible_tiles_after_move()
-            random_move = random.choice([move for move in moves if moves[move] >= 0])
-            new_pos = tuple(np.array(self.pos) + random_move)
-            # Only move to non-blocked tiles:
-            if self.grid.cells[new_pos] >= 0:
-                new_orient = list(self.dirs.keys())[list(self.dirs.values()).index(random_move)]
-                tile_after_move = self.grid.cells[new_pos]
-                self.grid.cells[self.pos] = 0
-                self.grid.cells[new_pos] = self.orients[new_orient]
-                self.pos = new_pos
-                self.history[0].append(self.pos[0])
-                self.history[1].append(self.pos[1])
-                if tile_after_move == 3:
-                    self.alive = False
-                    return False
-                return True
-            else:
+        cells = self.grid.cells
+        x, y = self.pos
+        if random_move:
+            # Move to a random neighbouring tile that is not blocked:
+            moves = [move for move in DIRECTIONS if cells.item(x + move[0], y + move[1]) >= 0]
+            if not moves:
                 return False
+            move = self.random.choice(moves)
+            new_orient = ORIENTATIONS[DIRECTIONS.index(move)]
         else:
-            new_pos = tuple(np.array(self.pos) + self.dirs[self.orientation])
-            # Only move to non-blocked tiles:
-            if self.grid.cells[new_pos] >= 0:
-                tile_after_move = self.grid.cells[new_pos]
-                self.grid.cells[self.pos] = 0
-                self.grid.cells[new_pos] = self.orients[self.orientation]
-                self.pos = new_pos
-                self.history[0].append(self.pos[0])
-                self.history[1].append(self.pos[1])
-                # Death:
-                if tile_after_move == 3:
-                    self.alive = False
-                    return False
-                return True
-            else:
+            move = self.dirs[self.orientation]
+            new_orient = self.orientation
+        new_pos = (x + move[0], y + move[1])
+        tile_after_move = cells.item(new_pos)
+        # Only move to non-blocked tiles:
+        if tile_after_move >= 0:
+            self.grid.set_cell(self.pos, 0)
+            self.grid.set_cell(new_pos, self.orients[new_orient])
+            self.pos = new_pos
+            self._record_move()
+            # Death:
+            if tile_after_move == 3:
+                self.alive = False
                 return False
+            return True
+        else:
+            return False
 
     def rotate(self, dir):
         current = list(self.orients.keys()).index(self.orientation)
@@ -90,7 +253,7 @@ class Robot:
             self.orientation = list(self.orients.keys())[(current + 1) % 4]
         elif dir == 'l':
             self.orientation = list(self.orients.keys())[current - 1]
-        self.grid.cells[self.pos] = self.orients[self.orientation]
+        self.grid.set_cell(self.pos, self.orients[self.orientation])
 
 
 class Grid:
@@ -98,22 +261,92 @@ class Grid:
         self.n_rows = n_rows
         self.n_cols = n_cols
         # Building the boundary of the grid:
-        self.cells = np.ones((n_cols, n_rows))
+        # All cell values (-6 to 3) fit in a single byte:
+        self.cells = np.ones((n_cols, n_rows), dtype=np.int8)
         self.cells[0, :] = self.cells[-1, :] = -1
         self.cells[:, 0] = self.cells[:, -1] = -1
+        self.recount()
+        # Cells changed through set_cell, only recorded after track_changes() is called:
+        self.changes = None
+
+    @classmethod
+    def from_cells(cls, cells):
+        """Creates a grid around an existing (n_cols, n_rows) int8 array of cell values, without copying it."""
+        grid = cls.__new__(cls)
+        grid.n_cols, grid.n_rows = cells.shape
+        grid.cells = cells
+        grid.recount()
+        grid.changes = None
+        return grid
+
+    def copy(self, out=None):
+        """Returns a copy of the grid. If out (a grid of the same size) is given, the cells are copied into its
+        array with np.copyto and out is returned, instead of allocating a new grid."""
+        if out is None:
+            out = Grid.from_cells(np.array(self.cells))
+        else:
+            np.copyto(out.cells, self.cells)
+            out.changes = None
+        out.stats = GridStats(**vars(self.stats))
+        return out
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Grids pickled before the cells were stored as bytes:
+        if self.cells.dtype != np.int8:
+            self.cells = self.cells.astype(np.int8)
+        # Grids pickled before the tile counts were kept:
+        if 'stats' not in state:
+            self.recount()
+        if 'changes' not in state:
+            self.changes = None
+
+    def recount(self):
+        """Recomputes the tile counts from scratch, needed after writing to cells directly."""
+        self.stats = GridStats()
+        self.stats.add_cells(self.cells)
+
+    def set_cell(self, pos, value):
+        """Sets a single cell while keeping the tile counts up to date."""
+        self.stats.update(self.cells.item(pos), value)
+        self.cells[pos] = value
+        if self.changes is not None:
+            self.changes[pos] = value
+
+    def set_cells(self, xs, ys, values):
+        """Array version of set_cell, for arrays of (distinct) positions and their values."""
+        self.stats.add_cells(self.cells[xs, ys], sign=-1)
+        self.cells[xs, ys] = values
+        self.stats.add_cells(self.cells[xs, ys])
+        if self.changes is not None:
+            for x, y, value in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist(), self.cells[xs, ys].tolist()):
+                self.changes[x, y] = value
+
+    def track_changes(self):
+        """Starts recording the cells that are changed through set_cell, see pop_changes."""
+        self.changes = {}
+
+    def pop_changes(self):
+        """Returns the (x, y, value) of every cell changed since the previous call, and clears the record."""
+        changes = [(int(x), int(y), int(value)) for (x, y), value in self.changes.items()]
+        self.changes = {}
+        return changes
 
     def put_obstacle(self, x0, x1, y0, y1, from_edge=1):
-        self.cells[max(x0, from_edge):min(x1 + 1, self.n_cols - from_edge),
-        max(y0, from_edge):min(y1 + 1, self.n_rows - from_edge)] = -2
+        area = (slice(max(x0, from_edge), min(x1 + 1, self.n_cols - from_edge)),
+                slice(max(y0, from_edge), min(y1 + 1, self.n_rows - from_edge)))
+        self.stats.add_cells(self.cells[area], sign=-1)
+        self.cells[area] = -2
+        self.stats.add_cells(self.cells[area])
 
     def put_singular_obstacle(self, x, y):
-        self.cells[x][y] = -2
+        self.set_cell((x, y), -2)
 
     def put_singular_goal(self, x, y):
-        self.cells[x][y] = 2
+        self.set_cell((x, y), 2)
 
     def put_singular_death(self, x, y):
-        self.cells[x][y] = 3
+        self.set_cell((x, y), 3)
 
 
 def generate_grid(n_cols, n_rows):
@@ -0,0 +1,318 @@
+import numpy as np
+
+from batched_environment import DIRS, ORIENT_CODES, ORIENTATIONS
+from environment import RandomStream, RobotStats, Trajectory, sensor_offsets
+
+
+class Fleet:
+    """Many robots on a single Grid, moving simultaneously.
+    The cells of the grid only hold the state of the tiles, the robots are kept in a layer of their own (occupancy:
+    the index of the robot standing on every tile, -1 for none), so robots never overwrite each other's tiles. A robot
+    cleans a tile when it enters it. Dead robots stay where they are and keep blocking their tile.
+    Every tick the robots first state the move they intend to make (step, or RobotView.move for the robot algorithms
+    in robot_configs), after which resolve carries out all moves at once:
+    - robots that want the same tile: one of them, picked at random, gets it and the others stay,
+    - two robots that want each other's tiles both stay,
+    - a robot can move onto the tile of a robot that moves away in the same tick, but not onto a robot that stays.
+    Every attribute (pos, orientation, battery_lvl, alive, ...) is an array over the robots."""
+
+    def __init__(self, grid, positions, orientation='n', p_move=0, battery_drain_p=0, battery_drain_lam=0, vision=1,
+                 rng=None):
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        self.n_robots = len(positions)
+        if ((grid.cells[positions[:, 0], positions[:, 1]] != 1).any()
+                or len(np.unique(positions, axis=0)) < self.n_robots):
+            raise ValueError
+        self.grid = grid
+        # Random numbers for the slips and the battery drain, and a stream of its own for every robot algorithm:
+        self.random = rng if isinstance(rng, RandomStream) else RandomStream(rng)
+        self.rng = self.random.rng
+        self.pos = positions.copy()
+        orientations = [orientation] * self.n_robots if isinstance(orientation, str) else orientation
+        self.orientation = np.array([ORIENTATIONS.index(o) for o in orientations])
+        self.occupancy = np.full(grid.cells.shape, -1, dtype=np.int32)
+        self.occupancy[self.pos[:, 0], self.pos[:, 1]] = np.arange(self.n_robots)
+        # The tiles the robots start on are clean:
+        grid.set_cells(self.pos[:, 0], self.pos[:, 1], 0)
+        self.p_move = p_move
+        self.battery_drain_p = battery_drain_p
+        self.battery_drain_lam = battery_drain_lam
+        self.battery_lvl = np.full(self.n_robots, 100.)
+        self.alive = np.ones(self.n_robots, dtype=bool)
+        self.vision = vision
+        # Statistics needed for the efficiency score:
+        self.n_moves = np.zeros(self.n_robots, dtype=int)
+        self.n_revisited = np.zeros(self.n_robots, dtype=int)
+        # The tiles (as x * n_rows + y) every robot moved onto, a set per robot so the memory grows with the moves
+        # and not with the number of robots times the size of the grid. RobotView.visits counts them from the history:
+        self.visited = [set() for i in range(self.n_robots)]
+        dtype = np.int16 if max(grid.cells.shape) <= np.iinfo(np.int16).max else np.int32
+        self.histories = [Trajectory(dtype) for i in range(self.n_robots)]
+        # Direction of the move every robot intends to make this tick, -1 for none:
+        self.intent = np.full(self.n_robots, -1)
+        self.views = [RobotView(self, i, random) for i, random in enumerate(self.random.spawn(self.n_robots))]
+        self._mark(self.pos[:, 0], self.pos[:, 1])
+
+    def _mark(self, xs, ys):
+        """Records what the tiles look like (a robot or the cell) for the delta protocol of the browser."""
+        changes = self.grid.changes
+        if changes is None:
+            return
+        for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist()):
+            robot = self.occupancy.item(x, y)
+            changes[x, y] = int(ORIENT_CODES[self.orientation[robot]]) if robot >= 0 else self.grid.cells.item(x, y)
+
+    def release(self):
+        """Takes the robots off the grid, e.g. before a new fleet is spawned on it."""
+        self.alive[:] = False
+        self.occupancy[self.pos[:, 0], self.pos[:, 1]] = -1
+        self._mark(self.pos[:, 0], self.pos[:, 1])
+
+    def render_cells(self):
+        """The cells with the robots painted on them (as their orientation codes), for display."""
+        cells = self.grid.cells.copy()
+        cells[self.pos[:, 0], self.pos[:, 1]] = ORIENT_CODES[self.orientation]
+        return cells
+
+    def observe(self):
+        """Returns the (n_robots, 4, vision) tile values the robots can see in directions n, e, s, w and a mask
+        telling which of them are inside the grid. Other robots read as their orientation codes, tiles outside the
+        grid as walls and death tiles as dirty."""
+        steps = np.arange(1, self.vision + 1)
+        xs = self.pos[:, 0, np.newaxis, np.newaxis] + DIRS[:, 0, np.newaxis] * steps
+        ys = self.pos[:, 1, np.newaxis, np.newaxis] + DIRS[:, 1, np.newaxis] * steps
+        n_cols, n_rows = self.grid.cells.shape
+        valid = (xs >= 0) & (xs < n_cols) & (ys >= 0) & (ys < n_rows)
+        xs, ys = np.clip(xs, 0, n_cols - 1), np.clip(ys, 0, n_rows - 1)
+        tiles = self.grid.cells[xs, ys]
+        tiles = np.where(tiles == 3, 1, tiles)
+        robots = self.occupancy[xs, ys]
+        tiles = np.where(robots >= 0, ORIENT_CODES[self.orientation[robots]], tiles)
+        tiles[~valid] = -1
+        return tiles, valid
+
+    def rotate(self, dir, mask=None):
+        """Rotates the selected robots that are alive, dir is either 'r', 'l' or an array with the number of
+        clockwise quarter turns for every robot (negative for counter clockwise)."""
+        rotating = self.alive.copy() if mask is None else self.alive & mask
+        if isinstance(dir, str):
+            turns = 1 if dir == 'r' else -1
+        else:
+            turns = np.broadcast_to(dir, rotating.shape)[rotating]
+        self.orientation[rotating] = (self.orientation[rotating] + turns) % 4
+        self._mark(self.pos[rotating, 0], self.pos[rotating, 1])
+
+    def step(self, directions, mask=None):
+        """Moves the selected robots in the given directions (indexes of ORIENTATIONS, an array or a single one) at
+        once, see resolve."""
+        selected = self.alive.copy() if mask is None else self.alive & mask
+        self.intent[selected] = np.broadcast_to(directions, selected.shape)[selected]
+        return self.resolve()
+
+    def resolve(self):
+        """Carries out the intended moves of this tick at once and clears them. Every moving robot drains its
+        battery and slips to a random free neighbouring tile with probability p_move, like Robot.move. Returns a
+        boolean array telling which robots moved and survived."""
+        direction = self.intent.copy()
+        self.intent[:] = -1
+        moving = (direction >= 0) & self.alive
+        cells, occupancy = self.grid.cells, self.occupancy
+        # Battery drain:
+        drain = moving & (self.rng.random(self.n_robots) < self.battery_drain_p) & (self.battery_lvl > 0)
+        self.battery_lvl[drain] -= self.rng.exponential(self.battery_drain_lam, drain.sum())
+        # Handle empty batteries:
+        empty = moving & (self.battery_lvl <= 0)
+        self.alive[empty] = False
+        moving &= ~empty
+        # Random moves go to one of the neighbouring tiles that are free at the start of the tick:
+        random_move = moving & (self.rng.random(self.n_robots) < self.p_move)
+        if random_move.any():
+            xs, ys = self.pos[:, 0, np.newaxis] + DIRS[:, 0], self.pos[:, 1, np.newaxis] + DIRS[:, 1]
+            free = (cells[xs, ys] >= 0) & (occupancy[xs, ys] < 0)
+            keys = np.where(free, self.rng.random(free.shape), -1)
+            direction = np.where(random_move, keys.argmax(axis=1), direction)
+            moving &= ~random_move | free.any(axis=1)
+        target = self.pos + DIRS[np.maximum(direction, 0)]
+        tx, ty = target[:, 0], target[:, 1]
+        # Only move to non-blocked tiles:
+        moving &= cells[tx, ty] >= 0
+        # Robots that want the same tile, only the first one in a random order gets it:
+        movers = np.flatnonzero(moving)
+        keys = tx[movers] * cells.shape[1] + ty[movers]
+        order = np.lexsort((self.rng.random(len(movers)), keys))
+        duplicate = np.zeros(len(movers), dtype=bool)
+        duplicate[1:] = keys[order][1:] == keys[order][:-1]
+        moving[movers[order[duplicate]]] = False
+        # Two robots that want each other's tiles both stay:
+        occupant = np.where(moving, occupancy[tx, ty], -1)
+        other = np.maximum(occupant, 0)
+        swap = (occupant >= 0) & moving[other] & (tx[other] == self.pos[:, 0]) & (ty[other] == self.pos[:, 1])
+        moving &= ~swap
+        # Robots moving onto a robot that stays, stay as well. Repeated for chains of robots following each other:
+        while True:
+            blocked = moving & (occupant >= 0) & ~moving[other]
+            if not blocked.any():
+                break
+            moving &= ~blocked
+
+        movers = np.flatnonzero(moving)
+        old_x, old_y = self.pos[movers, 0], self.pos[movers, 1]
+        new_x, new_y = tx[movers], ty[movers]
+        tile_after_move = cells[new_x, new_y]
+        occupancy[old_x, old_y] = -1
+        occupancy[new_x, new_y] = movers
+        self.pos[movers] = target[movers]
+        # The robots clean the tiles they enter, a death tile stays (with the dead robot on it):
+        cleaned = (tile_after_move == 1) | (tile_after_move == 2)
+        self.grid.set_cells(new_x[cleaned], new_y[cleaned], 0)
+        # Update the efficiency statistics and the histories:
+        self.n_moves[movers] += 1
+        n_rows = cells.shape[1]
+        revisited = []
+        for i, x, y in zip(movers.tolist(), new_x.tolist(), new_y.tolist()):
+            self.histories[i].append(x, y)
+            visited, tile = self.visited[i], x * n_rows + y
+            revisited.append(tile in visited)
+            visited.add(tile)
+        self.n_revisited[movers] += np.array(revisited, dtype=bool)
+        # Death:
+        died = tile_after_move == 3
+        self.alive[movers[died]] = False
+        self._mark(np.concatenate((old_x, new_x)), np.concatenate((old_y, new_y)))
+        moved = np.zeros(self.n_robots, dtype=bool)
+        moved[movers[~died]] = True
+        return moved
+
+    def tick(self, robot_epoch):
+        """One epoch of a robot algorithm for a single robot (a robot_epoch from robot_configs): it is called for the
+        view of every robot that is alive, after which all moves are carried out at once."""
+        for view in self.views:
+            if self.alive[view.index]:
+                robot_epoch(view)
+        return self.resolve()
+
+    def efficiency(self):
+        visitable = self.grid.stats.visitable
+        return (100 * visitable) / (visitable + self.n_revisited)
+
+
+class RobotView:
+    """A single robot of a Fleet behind the interface of environment.Robot, so the robot algorithms in robot_configs
+    can drive fleets. move() only states the intended move, which is carried out by Fleet.resolve at the end of the
+    tick. It returns False if the tile ahead is blocked by a wall, an obstacle or a robot (which drains the battery
+    like a blocked Robot.move), and for every move after the first one in a tick."""
+    orients = {'n': -3, 'e': -4, 's': -5, 'w': -6}
+    dirs = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
+
+    def __init__(self, fleet, index, random):
+        self.fleet = fleet
+        self.index = index
+        self.random = random
+
+    @property
+    def grid(self):
+        return self.fleet.grid
+
+    @property
+    def pos(self):
+        return int(self.fleet.pos[self.index, 0]), int(self.fleet.pos[self.index, 1])
+
+    @property
+    def orientation(self):
+        return ORIENTATIONS[self.fleet.orientation[self.index]]
+
+    @property
+    def alive(self):
+        return bool(self.fleet.alive[self.index])
+
+    @property
+    def battery_lvl(self):
+        return float(self.fleet.battery_lvl[self.index])
+
+    @property
+    def p_move(self):
+        return self.fleet.p_move
+
+    @property
+    def battery_drain_p(self):
+        return self.fleet.battery_drain_p
+
+    @property
+    def battery_drain_lam(self):
+        return self.fleet.battery_drain_lam
+
+    @property
+    def vision(self):
+        return self.fleet.vision
+
+    @property
+    def history(self):
+        return self.fleet.histories[self.index]
+
+    @property
+    def visits(self):
+        """Number of times the robot moved onto every tile, like Robot.visits, counted from its history."""
+        history = self.history
+        visits = np.zeros(self.fleet.grid.cells.shape, dtype=np.int32)
+        np.add.at(visits, (history[0], history[1]), 1)
+        return visits
+
+    @property
+    def stats(self):
+        stats = RobotStats()
+        stats.n_moves = int(self.fleet.n_moves[self.index])
+        stats.n_revisited = int(self.fleet.n_revisited[self.index])
+        return stats
+
+    @property
+    def efficiency(self):
+        visitable = self.fleet.grid.stats.visitable
+        return (100 * visitable) / (visitable + int(self.fleet.n_revisited[self.index]))
+
+    def _tile(self, x, y):
+        """The tile at x, y as the robot sees it: other robots as their orientation codes."""
+        robot = self.fleet.occupancy.item(x, y)
+        if robot >= 0:
+            return int(ORIENT_CODES[self.fleet.orientation[robot]])
+        return self.fleet.grid.cells.item(x, y)
+
+    def floor_plan(self):
+        """A copy of the cells of the room, for planners that are handed the map of the room. Like in
+        possible_tiles_after_move, death tiles are shown as dirty."""
+        cells = self.fleet.grid.cells
+        return np.where(cells == 3, 1, cells)
+
+    def possible_tiles_after_move(self):
+        n_cols, n_rows = self.fleet.grid.cells.shape
+        x, y = self.pos
+        data = {}
+        for move in sensor_offsets(self.fleet.vision):
+            to_x, to_y = x + move[0], y + move[1]
+            if 0 <= to_x < n_cols and 0 <= to_y < n_rows:
+                tile = self._tile(to_x, to_y)
+                # Fool the robot and show a death tile as normal (dirty):
+                data[move] = 1 if tile == 3 else tile
+        return data
+
+    def move(self):
+        fleet = self.fleet
+        if not fleet.alive[self.index] or fleet.intent[self.index] >= 0:
+            return False
+        direction = fleet.orientation[self.index]
+        x, y = self.pos
+        dx, dy = DIRS[direction]
+        if self._tile(x + dx, y + dy) < 0:
+            # A blocked move drains the battery all the same, like Robot.move:
+            if self.random.bernoulli(fleet.battery_drain_p) and fleet.battery_lvl[self.index] > 0:
+                fleet.battery_lvl[self.index] -= self.random.exponential(fleet.battery_drain_lam)
+            if fleet.battery_lvl[self.index] <= 0:
+                fleet.alive[self.index] = False
+            return False
+        fleet.intent[self.index] = direction
+        return True
+
+    def rotate(self, dir):
+        fleet = self.fleet
+        turns = 1 if dir == 'r' else -1 if dir == 'l' else 0
+        fleet.orientation[self.index] = (fleet.orientation[self.index] + turns) % 4
+        fleet._mark(fleet.pos[self.index:self.index + 1, 0], fleet.pos[self.index:self.index + 1, 1])
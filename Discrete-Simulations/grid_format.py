@@ -0,0 +1,134 @@
+"""Binary grid file format.
+
+A .bgrid file is a fixed size header followed by the raw int8 cell values of the grid, column major (shape
+(n_cols, n_rows), C order), so files can be memory-mapped. Header (little endian):
+    magic    8 bytes   b'DICGRID\0'
+    version  uint16    FORMAT_VERSION
+    n_cols   uint32
+    n_rows   uint32
+    padding up to HEADER_SIZE bytes.
+Pickled .grid files (the old format) can still be loaded, and converted with:
+    python grid_format.py grid_configs/*.grid
+The editor sends the cells in the same order, run-length encoded or base64 encoded, see decode_cells.
+"""
+import argparse
+import base64
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from environment import Grid
+
+GRID_EXTENSION = '.bgrid'
+MAGIC = b'DICGRID\0'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHII')
+HEADER_SIZE = 32
+# Cell values a grid can be built from, robots are only placed by a simulation:
+GRID_VALUES = (-2, -1, 0, 1, 2, 3)
+# Largest grid decode_cells accepts, keeps the sum of the run lengths well within int64:
+MAX_CELLS = 2 ** 31 - 1
+
+# Read-only template grids by path, see load_template:
+_templates = {}
+
+
+class GridUnpickler(pickle.Unpickler):
+    """Unpickler for .grid files. Some of them were pickled from app.py or a script run as __main__, which would
+    otherwise only load in a process that has Grid in that module."""
+
+    def find_class(self, module, name):
+        if name == 'Grid' and module in ('__main__', 'app'):
+            return Grid
+        return super().find_class(module, name)
+
+
+def save_grid(grid, path):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, grid.n_cols, grid.n_rows).ljust(HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(grid.cells, dtype=np.int8).tobytes())
+
+
+def read_header(path):
+    """Returns (version, n_cols, n_rows) of a binary grid file."""
+    with open(path, 'rb') as f:
+        magic, version, n_cols, n_rows = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a binary grid file!')
+    if version > FORMAT_VERSION:
+        raise ValueError(f'{path} has grid format version {version}, only versions up to {FORMAT_VERSION} are known!')
+    return version, n_cols, n_rows
+
+
+def load_grid(path, mmap=False):
+    """Loads a grid from a binary grid file or a pickled (.grid) one. With mmap=True the cells of a binary grid are
+    memory-mapped read-only instead of read into memory."""
+    if not path.endswith(GRID_EXTENSION):
+        with open(path, 'rb') as f:
+            return GridUnpickler(f).load()
+    version, n_cols, n_rows = read_header(path)
+    if mmap:
+        cells = np.memmap(path, dtype=np.int8, mode='r', offset=HEADER_SIZE, shape=(n_cols, n_rows))
+    else:
+        cells = np.fromfile(path, dtype=np.int8, offset=HEADER_SIZE, count=n_cols * n_rows).reshape(n_cols, n_rows)
+    return Grid.from_cells(cells)
+
+
+def load_template(path):
+    """Returns a read-only grid for path, which is only loaded (memory-mapped) once and reloaded when the file
+    changes. Use template.copy() to get a grid to run an episode on, or template.copy(out=grid) to reuse the memory
+    of a previous episode's grid."""
+    key = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    if key not in _templates or _templates[key][0] != mtime:
+        template = load_grid(path, mmap=True)
+        template.cells.flags.writeable = False
+        _templates[key] = (mtime, template)
+    return _templates[key][1]
+
+
+def decode_cells(n_cols, n_rows, encoding, data):
+    """Returns a new (n_cols, n_rows) int8 array from a compact payload of cells, column major like the binary format.
+    encoding 'rle': data is a flat list [value, count, value, count, ...] of runs of equal values.
+    encoding 'base64': data is the base64 encoded int8 array.
+    Raises a ValueError if the payload is not a grid of that size with valid cell values."""
+    if n_cols < 1 or n_rows < 1 or n_cols * n_rows > MAX_CELLS:
+        raise ValueError(f'A grid has to have between 1 and {MAX_CELLS} cells!')
+    n_cells = n_cols * n_rows
+    if encoding == 'rle':
+        try:
+            runs = np.asarray(data, dtype=np.int64)
+        except OverflowError:
+            raise ValueError('The runs must fit in 64 bit integers!') from None
+        if runs.ndim != 1 or len(runs) % 2 or len(runs) > 2 * n_cells:
+            raise ValueError('The runs must be a flat list of at most one value, count pair per cell!')
+        runs = runs.reshape(-1, 2)
+        # Check every count before summing them, so the sum can not overflow, and before expanding the runs:
+        if (runs[:, 1] < 0).any() or (runs[:, 1] > n_cells).any() or runs[:, 1].sum() != n_cells:
+            raise ValueError(f'The runs do not add up to {n_cols} by {n_rows} cells!')
+        cells = np.repeat(runs[:, 0], runs[:, 1])
+    elif encoding == 'base64':
+        cells = np.frombuffer(base64.b64decode(data, validate=True), dtype=np.int8)
+        if len(cells) != n_cells:
+            raise ValueError(f'Got {len(cells)} cells for a grid of {n_cols} by {n_rows}!')
+    else:
+        raise ValueError(f'Unknown cell encoding {encoding}!')
+    if not np.isin(cells, GRID_VALUES).all():
+        raise ValueError(f'Cell values must be one of {GRID_VALUES}!')
+    return cells.astype(np.int8).reshape(n_cols, n_rows)
+
+
+def convert(path):
+    """Converts a pickled grid file to a binary one next to it, returns the path of the new file."""
+    new_path = os.path.splitext(path)[0] + GRID_EXTENSION
+    save_grid(load_grid(path), new_path)
+    return new_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert pickled .grid files to the binary grid format.')
+    parser.add_argument('files', nargs='+', help='pickled grid files')
+    for file in parser.parse_args().files:
+        print(f'{file} -> {convert(file)}')
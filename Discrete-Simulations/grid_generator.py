@@ -1,33 +1,222 @@
-from environment import Grid
+"""Procedural grid generator.
+
+Every layout family is a function of a numpy Generator and the grid size that returns the cell values as an
+(n_cols, n_rows) int8 array, built with array operations only, so maps of thousands of cells per side take seconds.
+A grid is fully defined by its family, size, parameters and seed, see generate. The CLI streams batches of grids to
+disk in the binary grid format and appends a line per grid to a JSON lines manifest with its connectivity:
+    python grid_generator.py house --count 5 --cols 10 20 --rows 10 20 --name example-random-house
+    python grid_generator.py maze --count 10 --cols 4001 --rows 4001 --goal-density 0.001 --out /tmp/grids
+"""
+import argparse
+import json
 import os
+import time
+
 import numpy as np
-import pickle
-
-PATH = os.getcwd()
-
-for k in range(5):
-    # Get a grid with a random height and width:
-    height = np.random.randint(10, 20)
-    width = np.random.randint(10, 20)
-    grid = Grid(width, height)
-    # Create the corridor:
-    corr_y0 = int(height / 2)
-    corr_y1 = int(height / 2) + 2
-
-    n_rooms = 5
-    # Get upper rooms:
-    rooms = np.random.randint(2, n_rooms)
-    for i in range(0, width, width//rooms):
-        grid.put_obstacle(x0=i, x1=i + (width//rooms) -2, y0=corr_y0, y1=corr_y0)
-    for i in range(0, rooms-1):
-        grid.put_obstacle(x0=(i+1) * int(width / rooms), x1=(i+1) *int(width / rooms), y0=1, y1=corr_y0)
-
-    # Get lower rooms:
-    rooms = np.random.randint(2, n_rooms)
-    for i in range(0, width, width // rooms):
-        grid.put_obstacle(x0=i, x1=i + (width // rooms) - 2, y0=corr_y1, y1=corr_y1)
-    for i in range(0, rooms - 1):
-        grid.put_obstacle(x0=(i + 1) * int(width / rooms), x1=(i + 1) * int(width / rooms), y0=corr_y1, y1=height)
-
-    name = 'example-random-house'
-    pickle.dump(grid, open(f'{PATH}/grid_configs/{name}-{k}.grid', 'wb'))
\ No newline at end of file
+
+from environment import Grid
+from grid_format import GRID_EXTENSION, save_grid
+
+
+def empty_cells(n_cols, n_rows):
+    """Dirty cells surrounded by walls, like a new Grid."""
+    cells = np.ones((n_cols, n_rows), dtype=np.int8)
+    cells[0, :] = cells[-1, :] = -1
+    cells[:, 0] = cells[:, -1] = -1
+    return cells
+
+
+def wall_positions(rng, size, n_rooms):
+    """Positions of the n_rooms - 1 walls that split 1..size - 2 into rooms of at least 2 tiles, evenly spaced with
+    some jitter."""
+    spacing = (size - 1) / n_rooms
+    positions = np.round(spacing * np.arange(1, n_rooms) + rng.uniform(-spacing / 6, spacing / 6, n_rooms - 1))
+    return positions.astype(np.int64)
+
+
+def doors(rng, walls, size):
+    """A random door position in every segment of a wall between the walls crossing it, as a (n_segments,) array
+    with the segments of the consecutive crossing walls."""
+    bounds = np.concatenate(([0], walls, [size - 1]))
+    low, high = bounds[:-1] + 1, bounds[1:] - 1
+    return low + np.floor(rng.random(len(low)) * (high - low + 1)).astype(np.int64)
+
+
+def house(rng, n_cols, n_rows, n_rooms=6):
+    """Rooms on a jittered lattice of walls, with a door between every pair of neighbouring rooms."""
+    # Split the rooms over the columns and rows in proportion to the size of the grid:
+    room_cols = int(np.clip(round(np.sqrt(n_rooms * n_cols / n_rows)), 1, max(1, (n_cols - 2) // 3)))
+    room_rows = int(np.clip(int(np.ceil(n_rooms / room_cols)), 1, max(1, (n_rows - 2) // 3)))
+    cells = empty_cells(n_cols, n_rows)
+    xs, ys = wall_positions(rng, n_cols, room_cols), wall_positions(rng, n_rows, room_rows)
+    cells[xs, 1:-1] = -2
+    cells[1:-1, ys] = -2
+    # A door in every wall segment, a segment of a vertical wall lies between two horizontal walls and vice versa:
+    for x in xs:
+        cells[x, doors(rng, ys, n_rows)] = 1
+    for y in ys:
+        cells[doors(rng, xs, n_cols), y] = 1
+    return cells
+
+
+def maze(rng, n_cols, n_rows):
+    """Binary tree maze: every maze cell (at odd coordinates) opens either to the north or to the east, which gives
+    a perfect maze (exactly one path between any two tiles)."""
+    cells = np.full((n_cols, n_rows), -2, dtype=np.int8)
+    cells[0, :] = cells[-1, :] = -1
+    cells[:, 0] = cells[:, -1] = -1
+    width, height = (n_cols - 1) // 2, (n_rows - 1) // 2
+    if width == 0 or height == 0:
+        return cells
+    i, j = np.meshgrid(np.arange(width), np.arange(height), indexing='ij')
+    cells[2 * i + 1, 2 * j + 1] = 1
+    north = rng.random((width, height)) < 0.5
+    # The top row can only open to the east and the last column only to the north:
+    north[:, 0] = False
+    north[-1, :] = True
+    north[-1, 0] = False
+    east = ~north
+    east[-1, :] = False
+    cells[2 * i[north] + 1, 2 * j[north]] = 1
+    cells[2 * i[east] + 2, 2 * j[east] + 1] = 1
+    return cells
+
+
+def obstacle_field(rng, n_cols, n_rows, density=0.2, max_size=3):
+    """Randomly placed rectangular obstacles of 1..max_size tiles per side, covering about density of the grid
+    (overlapping obstacles cover less)."""
+    cells = empty_cells(n_cols, n_rows)
+    mean_area = ((1 + max_size) / 2) ** 2
+    n_obstacles = rng.poisson(density * (n_cols - 2) * (n_rows - 2) / mean_area)
+    x0, y0 = rng.integers(1, n_cols - 1, n_obstacles), rng.integers(1, n_rows - 1, n_obstacles)
+    x1 = np.minimum(x0 + rng.integers(1, max_size + 1, n_obstacles), n_cols - 1)
+    y1 = np.minimum(y0 + rng.integers(1, max_size + 1, n_obstacles), n_rows - 1)
+    # Paint all rectangles at once with a 2d difference array:
+    covered = np.zeros((n_cols + 1, n_rows + 1), dtype=np.int32)
+    np.add.at(covered, (x0, y0), 1)
+    np.add.at(covered, (x1, y0), -1)
+    np.add.at(covered, (x0, y1), -1)
+    np.add.at(covered, (x1, y1), 1)
+    covered = covered.cumsum(axis=0, dtype=np.int32).cumsum(axis=1, dtype=np.int32)[:n_cols, :n_rows]
+    cells[covered > 0] = -2
+    return cells
+
+
+FAMILIES = {'house': house, 'maze': maze, 'obstacles': obstacle_field}
+
+
+def sprinkle(rng, cells, value, density):
+    """Sets about density of the dirty tiles to value (e.g. 2 for goals, 3 for death tiles). Positions are drawn
+    with replacement from the whole grid, which avoids listing the dirty tiles of large grids."""
+    n = rng.binomial(cells.size, density)
+    x, y = rng.integers(0, cells.shape[0], n), rng.integers(0, cells.shape[1], n)
+    dirty = cells[x, y] == 1
+    cells[x[dirty], y[dirty]] = value
+
+
+def generate(family, n_cols, n_rows, seed=None, goal_density=0, death_density=0, spawn=(1, 1), **params):
+    """Generates a grid of the given layout family (see FAMILIES) and size. params are passed to the family
+    function. The spawn tile is always left dirty, so robots can start there."""
+    rng = np.random.default_rng(seed)
+    cells = FAMILIES[family](rng, n_cols, n_rows, **params)
+    sprinkle(rng, cells, 2, goal_density)
+    sprinkle(rng, cells, 3, death_density)
+    if spawn is not None:
+        cells[spawn] = 1
+    return Grid.from_cells(cells)
+
+
+def connected_components(free):
+    """Labels the 4-connected components of a bool (n_cols, n_rows) array. Returns a flat int32 array with, for every
+    free cell, the smallest flat index in its component (and its own index for blocked cells).
+    Works on arrays only: in every round the root of the larger label of every pair of neighbours with different
+    labels is hooked onto the smaller label, then the labels are shortcut to their roots by pointer jumping, so the
+    number of rounds grows with the log of the component sizes instead of their diameter."""
+    n_rows = free.shape[1]
+    labels = np.arange(free.size, dtype=np.int32)
+    # Pairs (u, u + 1) of free neighbours in the y direction and (u, u + n_rows) in the x direction:
+    pairs = np.zeros_like(free)
+    pairs[:, :-1] = free[:, :-1] & free[:, 1:]
+    u_y = np.flatnonzero(pairs).astype(np.int32)
+    pairs[:] = False
+    pairs[:-1, :] = free[:-1, :] & free[1:, :]
+    u_x = np.flatnonzero(pairs).astype(np.int32)
+    u, v = np.concatenate((u_y, u_x)), np.concatenate((u_y + 1, u_x + n_rows))
+    del pairs, u_y, u_x
+    while True:
+        label_u, label_v = labels[u], labels[v]
+        different = label_u != label_v
+        if not different.any():
+            return labels
+        # Neighbours in the same component stay there, so only the other pairs have to be kept:
+        u, v, label_u, label_v = u[different], v[different], label_u[different], label_v[different]
+        np.minimum.at(labels, np.maximum(label_u, label_v), np.minimum(label_u, label_v))
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+def connectivity(cells, spawn=(1, 1)):
+    """Number of visitable tiles (everything except walls and obstacles), the number of connected areas they form,
+    the size of the largest one and the number of tiles that can be reached from spawn."""
+    free = (cells != -1) & (cells != -2)
+    labels = connected_components(free)
+    free = free.ravel()
+    roots = np.flatnonzero(free & (labels == np.arange(free.size, dtype=np.int32)))
+    sizes = np.bincount(np.searchsorted(roots, labels[free]), minlength=len(roots))
+    spawn_index = np.ravel_multi_index(spawn, cells.shape)
+    reachable = int(sizes[np.searchsorted(roots, labels[spawn_index])]) if free[spawn_index] else 0
+    return {'visitable': int(free.sum()), 'n_components': len(roots),
+            'largest_component': int(sizes.max(initial=0)), 'reachable': reachable}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate grids in bulk, reproducibly from a seed.')
+    parser.add_argument('family', nargs='?', default='house', choices=sorted(FAMILIES))
+    parser.add_argument('--count', type=int, default=5, help='number of grids')
+    parser.add_argument('--seed', type=int, default=0, help='grid k is generated with seed + k')
+    parser.add_argument('--cols', type=int, nargs='+', default=[10, 20], metavar='N',
+                        help='number of columns, or a MIN MAX range to draw it from')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 20], metavar='N',
+                        help='number of rows, or a MIN MAX range to draw it from')
+    parser.add_argument('--rooms', type=int, default=None, help='number of rooms (house)')
+    parser.add_argument('--density', type=float, default=None, help='obstacle density (obstacles)')
+    parser.add_argument('--max-size', type=int, default=None, help='maximum obstacle size (obstacles)')
+    parser.add_argument('--goal-density', type=float, default=0)
+    parser.add_argument('--death-density', type=float, default=0)
+    parser.add_argument('--out', default='grid_configs', help='folder to write the grids to')
+    parser.add_argument('--name', default=None, help='file name prefix (default: the family)')
+    parser.add_argument('--manifest', default=None,
+                        help='JSON lines manifest, kept out of OUT so the app does not list it '
+                             '(default: OUT_manifest.jsonl)')
+    args = parser.parse_args()
+
+    params = {key: value for key, value in
+              (('n_rooms', args.rooms), ('density', args.density), ('max_size', args.max_size)) if value is not None}
+    name = args.name or args.family
+    os.makedirs(args.out, exist_ok=True)
+    with open(args.manifest or os.path.normpath(args.out) + '_manifest.jsonl', 'a') as manifest:
+        for k in range(args.count):
+            seed = args.seed + k
+            # The size is drawn from its own generator, so the layout of a grid only depends on its seed and size:
+            size_rng = np.random.default_rng([seed, 0])
+            n_cols = int(size_rng.integers(args.cols[0], args.cols[-1], endpoint=True))
+            n_rows = int(size_rng.integers(args.rows[0], args.rows[-1], endpoint=True))
+            started = time.perf_counter()
+            grid = generate(args.family, n_cols, n_rows, seed=seed, goal_density=args.goal_density,
+                            death_density=args.death_density, **params)
+            path = os.path.join(args.out, f'{name}-{k}{GRID_EXTENSION}')
+            save_grid(grid, path)
+            entry = {'file': path, 'family': args.family, 'seed': seed, 'n_cols': n_cols, 'n_rows': n_rows,
+                     'params': params, 'goal_density': args.goal_density, 'death_density': args.death_density,
+                     'goals': grid.stats.goal, 'dirty': grid.stats.dirty, **connectivity(grid.cells)}
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+            print(f"{path}: {n_cols}x{n_rows}, {entry['visitable']} visitable tiles, {entry['n_components']} "
+                  f"components, {entry['reachable']} reachable from (1, 1) ({time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
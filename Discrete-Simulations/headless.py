@@ -1,67 +1,271 @@
-# Import our robot algorithm to use in this simulation:
-from robot_configs.greedy_random_robot import robot_epoch
-import pickle
+import argparse
+import csv
+import os
+import random
+from multiprocessing import Pool
+
+import numpy as np
+
+import instrumentation
 from environment import Robot
-import matplotlib.pyplot as plt
+from grid_format import load_template
+from online_stats import Histogram, MetricStats, wilson_halfwidth, z_value
+from recording import RECORDING_EXTENSION, Recorder
+from robot_registry import registry
+
 
-grid_file = 'house.grid'
-# Cleaned tile percentage at which the room is considered 'clean':
-stopping_criteria = 100
+def episode_seeds(seed, n_episodes):
+    """Derives an independent, deterministic seed for every episode from a single master seed."""
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n_episodes)]
 
-# Keep track of some statistics:
-efficiencies = []
-n_moves = []
-deaths = 0
-cleaned = []
 
-# Run 100 times:
-for i in range(100):
-    # Open the grid file.
+def run_episode(episode, seed, grid_file='house.grid', robot_alg='greedy_random_robot', stopping_criteria=100,
+                spawn=(1, 1), orientation='n', robot_params=None, instrument=False, record=None, keyframe_interval=100):
+    """Runs a single simulation instance and returns its statistics.
+    episode: index of the episode, only passed through to the result.
+    seed: seed of the random numbers of the robot (see environment.RandomStream), and of the random and the numpy
+        random number generators for algorithms that use those.
+    grid_file: file in the grid_configs folder to run on.
+    robot_alg: name of the module in the robot_configs folder that contains the robot_epoch to use.
+    stopping_criteria: cleaned tile percentage at which the room is considered 'clean'.
+    spawn, orientation: starting position and orientation of the robot.
+    robot_params: extra keyword arguments for Robot (p_move, battery_drain_p, battery_drain_lam, vision).
+    instrument: time the phases of the episode, the result then has a 'metrics' entry with an
+        instrumentation.snapshot() of just this episode.
+    record: folder to write a recording of the episode to (see recording.py), as episode_<episode>.rec.
+    keyframe_interval: number of epochs between two keyframes of the recording.
+    """
+    if instrument:
+        instrumentation.enable()
+        # Record this episode on its own, what was recorded before (or merged into this process) is kept:
+        instrumentation.push()
+    random.seed(seed)
+    np.random.seed(seed)
+    robot_epoch = registry.robot_epoch(robot_alg)
+    # Get a fresh copy of the grid, the file is only read once per process.
     # (You can create one yourself using the provided editor).
-    with open(f'grid_configs/{grid_file}', 'rb') as f:
-        grid = pickle.load(f)
-    # Calculate the total visitable tiles:
-    n_total_tiles = (grid.cells >= 0).sum()
-    # Spawn the robot at (1,1) facing north with battery drainage enabled:
-    robot = Robot(grid, (1, 1), orientation='n', battery_drain_p=0.5, battery_drain_lam=2)
+    grid = load_template(f'grid_configs/{grid_file}').copy()
+    robot = Robot(grid, tuple(spawn), orientation=orientation, rng=seed, **(robot_params or {}))
+    recorder = None
+    if record is not None:
+        recorder = Recorder(os.path.join(record, f'episode_{episode:05d}{RECORDING_EXTENSION}'), grid, [robot],
+                            keyframe_interval=keyframe_interval,
+                            meta={'episode': episode, 'seed': seed, 'grid_file': grid_file, 'robot_alg': robot_alg,
+                                  'robot_params': robot_params, 'spawn': list(spawn), 'orientation': orientation})
     # Keep track of the number of robot decision epochs:
     n_epochs = 0
     while True:
         n_epochs += 1
         # Do a robot epoch (basically call the robot algorithm once):
-        robot_epoch(robot)
+        with instrumentation.phase('robot_epoch'):
+            robot_epoch(robot)
+        if recorder is not None:
+            with instrumentation.phase('record'):
+                recorder.epoch()
+        instrumentation.epoch_done()
         # Stop this simulation instance if robot died :( :
         if not robot.alive:
-            deaths += 1
             break
-        # Calculate some statistics:
-        clean = (grid.cells == 0).sum()
-        dirty = (grid.cells >= 1).sum()
-        goal = (grid.cells == 2).sum()
-        # Calculate the cleaned percentage:
-        clean_percent = (clean / (dirty + clean)) * 100
         # See if the room can be considered clean, if so, stop the simulaiton instance:
-        if clean_percent >= stopping_criteria and goal == 0:
+        with instrumentation.phase('stats'):
+            clean = grid.stats.clean_percent >= stopping_criteria and grid.stats.goal == 0
+        if clean:
             break
-        # Calculate the effiency score:
-        moves = [(x, y) for (x, y) in zip(robot.history[0], robot.history[1])]
-        u_moves = set(moves)
-        n_revisted_tiles = len(moves) - len(u_moves)
-        efficiency = (100 * n_total_tiles) / (n_total_tiles + n_revisted_tiles)
-    # Keep track of the last statistics for each simulation instance:
-    efficiencies.append(float(efficiency))
-    n_moves.append(len(robot.history[0]))
-    cleaned.append(clean_percent)
-
-# Make some plots:
-plt.hist(cleaned)
-plt.title('Percentage of tiles cleaned.')
-plt.xlabel('% cleaned')
-plt.ylabel('count')
-plt.show()
-
-plt.hist(efficiencies)
-plt.title('Efficiency of robot.')
-plt.xlabel('Efficiency %')
-plt.ylabel('count')
-plt.show()
+    result = {'episode': episode, 'seed': seed, 'efficiency': float(robot.efficiency), 'n_moves': robot.stats.n_moves,
+              'cleaned': float(grid.stats.clean_percent), 'died': not robot.alive, 'n_epochs': n_epochs}
+    if recorder is not None:
+        recorder.meta['result'] = dict(result)
+        recorder.close()
+    if instrument:
+        instrumentation.count('episodes')
+        instrumentation.count('epochs', n_epochs)
+        result['metrics'] = instrumentation.pop()
+    return result
+
+
+def _run_episode(args):
+    episode, seed, kwargs = args
+    return run_episode(episode, seed, **kwargs)
+
+
+def run(n_episodes=100, seed=0, n_workers=None, chunksize=None, **kwargs):
+    """Runs n_episodes simulation instances spread over a pool of n_workers processes (all cores by default),
+    yielding the result of every episode as soon as it is finished. Results arrive out of order, but every episode
+    is seeded from the master seed, so the set of results is the same for any number of workers.
+    kwargs are passed to run_episode."""
+    jobs = [(episode, episode_seed, kwargs) for episode, episode_seed in enumerate(episode_seeds(seed, n_episodes))]
+    if n_workers == 1:
+        # Run in this process, which makes debugging robot algorithms easier:
+        yield from map(_run_episode, jobs)
+        return
+    n_workers = n_workers or os.cpu_count()
+    if chunksize is None:
+        # A few chunks per worker keeps the overhead low while still balancing the load:
+        chunksize = max(1, n_episodes // (4 * n_workers))
+    with Pool(n_workers) as pool:
+        yield from pool.imap_unordered(_run_episode, jobs, chunksize=chunksize)
+
+
+class Evaluation:
+    """Online statistics of the results of a stream of episodes: mean, variance and quantiles of the cleaned
+    percentage, the efficiency and the number of moves, and the death rate. Only the statistics are kept, not the
+    results themselves."""
+    METRICS = ('cleaned', 'efficiency', 'n_moves')
+
+    def __init__(self, confidence=0.95):
+        self.confidence = confidence
+        self.z = z_value(confidence)
+        self.n = 0
+        self.deaths = 0
+        # Histograms of the percentages, for plotting:
+        self.metrics = {'cleaned': MetricStats(Histogram(0, 100, 20)), 'efficiency': MetricStats(Histogram(0, 100, 20)),
+                        'n_moves': MetricStats()}
+
+    def add(self, result):
+        self.n += 1
+        self.deaths += result['died']
+        for name, stats in self.metrics.items():
+            stats.add(result[name])
+
+    def halfwidths(self):
+        """Half the widths of the confidence intervals of the mean cleaned percentage and efficiency and of the death
+        rate (as a percentage)."""
+        return {'cleaned': self.metrics['cleaned'].moments.halfwidth(self.z),
+                'efficiency': self.metrics['efficiency'].moments.halfwidth(self.z),
+                'death rate': 100 * wilson_halfwidth(self.deaths, self.n, self.z)}
+
+    def precise(self, precision):
+        """Whether all confidence intervals are within +-precision percentage points."""
+        return all(halfwidth <= precision for halfwidth in self.halfwidths().values())
+
+    def report(self):
+        if self.n == 0:  # Nothing to report on, e.g. an empty run or one interrupted before an episode finished:
+            return 'No episodes finished.'
+        halfwidths = self.halfwidths()
+        lines = [f"Mean efficiency: {self.metrics['efficiency'].mean:.2f}%, "
+                 f"mean cleaned: {self.metrics['cleaned'].mean:.2f}%, "
+                 f"mean moves: {self.metrics['n_moves'].mean:.1f}, deaths: {self.deaths}/{self.n}",
+                 f"{self.confidence:.0%} confidence intervals: cleaned +-{halfwidths['cleaned']:.2f}, "
+                 f"efficiency +-{halfwidths['efficiency']:.2f}, death rate {100 * self.deaths / self.n:.1f}% "
+                 f"+-{halfwidths['death rate']:.2f}"]
+        for name, stats in self.metrics.items():
+            lines.append(f'{name:<11} min {stats.minimum:8.2f}  p10 {stats.quantile(0.1):8.2f}  '
+                         f'median {stats.quantile(0.5):8.2f}  p90 {stats.quantile(0.9):8.2f}  max {stats.maximum:8.2f}')
+        return '\n'.join(lines)
+
+
+def in_order(results):
+    """Yields the results of run by episode, holding back the ones that finish early. This makes the stream (and
+    with it the CSV file and the point where an adaptive evaluation stops) the same for any number of workers."""
+    pending, next_episode = {}, 0
+    for result in results:
+        pending[result['episode']] = result
+        while next_episode in pending:
+            yield pending.pop(next_episode)
+            next_episode += 1
+
+
+CSV_FIELDS = ('episode', 'seed', 'efficiency', 'n_moves', 'cleaned', 'died', 'n_epochs')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run simulation instances of a robot algorithm without a UI.')
+    parser.add_argument('--grid', default='house.grid', help='grid file in the grid_configs folder')
+    parser.add_argument('--robot', default='greedy_random_robot', help='robot algorithm in the robot_configs folder')
+    parser.add_argument('--episodes', type=int, default=100,
+                        help='number of simulation instances, the maximum with --precision')
+    parser.add_argument('--precision', type=float, default=None,
+                        help='run episodes until the confidence intervals of the mean cleaned percentage, the mean '
+                             'efficiency and the death rate are within +- this many percentage points')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--min-episodes', type=int, default=20,
+                        help='number of episodes to run before stopping on --precision')
+    parser.add_argument('--csv', default=None, help='write a row per episode to this CSV file, as they finish')
+    parser.add_argument('--quiet', action='store_true', help="don't print a line per episode")
+    parser.add_argument('--seed', type=int, default=0, help='master seed the episode seeds are derived from')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--stopping-criteria', type=float, default=100,
+                        help="cleaned tile percentage at which the room is considered 'clean'")
+    parser.add_argument('--spawn', type=int, nargs=2, default=(1, 1), metavar=('X', 'Y'))
+    parser.add_argument('--orientation', default='n', choices=['n', 'e', 's', 'w'])
+    parser.add_argument('--p-move', type=float, default=0)
+    parser.add_argument('--battery-drain-p', type=float, default=0.5)
+    parser.add_argument('--battery-drain-lam', type=float, default=2)
+    parser.add_argument('--vision', type=int, default=1)
+    parser.add_argument('--plot', nargs='?', const='', default=None, metavar='FILE',
+                        help='plot histograms of the results, saved to FILE if given')
+    parser.add_argument('--record', default=None, metavar='FOLDER',
+                        help='write a recording of every episode to this folder, to replay them in the browser')
+    parser.add_argument('--keyframe-interval', type=int, default=100,
+                        help='number of epochs between two keyframes of the recordings')
+    parser.add_argument('--instrument', action='store_true', help='time the phases of the episodes and print a summary')
+    parser.add_argument('--profile', type=int, default=None, metavar='N',
+                        help='profile N epochs (runs the episodes in this process)')
+    parser.add_argument('--profile-start', type=int, default=0, help='number of epochs to run before profiling')
+    parser.add_argument('--profile-mode', default='cprofile', choices=['cprofile', 'sample'])
+    args = parser.parse_args()
+    if args.profile is not None:
+        args.workers = 1
+        instrumentation.start_profile(args.profile, start=args.profile_start, mode=args.profile_mode)
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+    if args.instrument:
+        # The metrics of all episodes are combined here, they may have run in other processes:
+        instrumentation.reset()
+
+    robot_params = {'p_move': args.p_move, 'battery_drain_p': args.battery_drain_p,
+                    'battery_drain_lam': args.battery_drain_lam, 'vision': args.vision}
+    evaluation = Evaluation(args.confidence)
+    # In adaptive mode the pool is stopped as soon as the results are precise enough, small chunks waste less:
+    chunksize = 1 if args.precision is not None else None
+    csv_file = open(args.csv, 'w', newline='') if args.csv else None
+    try:
+        writer = csv.DictWriter(csv_file, CSV_FIELDS) if csv_file else None
+        if writer:
+            writer.writeheader()
+        for result in in_order(run(args.episodes, seed=args.seed, n_workers=args.workers, chunksize=chunksize,
+                                   grid_file=args.grid, robot_alg=args.robot,
+                                   stopping_criteria=args.stopping_criteria, spawn=args.spawn,
+                                   orientation=args.orientation, robot_params=robot_params,
+                                   instrument=args.instrument, record=args.record,
+                                   keyframe_interval=args.keyframe_interval)):
+            if args.instrument:
+                instrumentation.merge(result.pop('metrics'))
+            evaluation.add(result)
+            if not args.quiet:
+                print(f"episode {result['episode']}: efficiency {result['efficiency']:.2f}%, "
+                      f"moves {result['n_moves']}, cleaned {result['cleaned']:.2f}%, died {result['died']}")
+            if writer:
+                writer.writerow(result)
+                csv_file.flush()
+            if (args.precision is not None and evaluation.n >= args.min_episodes
+                    and evaluation.precise(args.precision)):
+                break
+    finally:
+        if csv_file:
+            csv_file.close()
+    print(evaluation.report())
+    if args.instrument:
+        print(instrumentation.summary())
+    if args.profile is not None:
+        print(instrumentation.profiler.report())
+
+    if args.plot is not None:
+        import matplotlib.pyplot as plt
+        # Make some plots, from the histograms that were kept along the way:
+        fig, (ax_cleaned, ax_efficiency) = plt.subplots(1, 2, figsize=(10, 4))
+        for ax, name, title in ((ax_cleaned, 'cleaned', 'Percentage of tiles cleaned.'),
+                                (ax_efficiency, 'efficiency', 'Efficiency of robot.')):
+            histogram = evaluation.metrics[name].histogram
+            ax.stairs(histogram.counts, histogram.edges, fill=True)
+            ax.set_title(title)
+            ax.set_xlabel(f'% {name}')
+            ax.set_ylabel('count')
+        if args.plot:
+            fig.savefig(args.plot)
+        else:
+            plt.show()
+
+
+if __name__ == '__main__':
+    main()
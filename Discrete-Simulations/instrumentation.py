@@ -0,0 +1,314 @@
+"""Per phase timers, counters and histograms for the simulation loops.
+
+Instrumentation is off by default and then costs next to nothing: phase() returns a shared no-op context manager,
+timed() functions only check a flag, and the Robot methods are not wrapped at all. enable() wraps Robot.move, rotate
+and the sensor methods with timers, and the same methods of fleet_environment.RobotView (the robots of the app), after
+which every phase records its call count, total time and a histogram of durations (power of 2 nanosecond buckets).
+Phases nest, so the time of robot_epoch includes its moves and rotations. In the app the move phase holds both the
+RobotView.move calls that state the moves and the Fleet.resolve calls that carry them out.
+Phases used by app.py and headless.py: robot_epoch, move, rotate, sensor, stats, render, plot and emit.
+
+A cProfile or sampling profile can be captured for a window of epochs with start_profile, the loops call
+epoch_done() after every epoch to move the window along.
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+enabled = False
+# Power of 2 buckets of nanoseconds, the last one collects everything above 2^38 ns (~4.6 minutes):
+N_BUCKETS = 40
+# Robot (and RobotView) methods that are wrapped with a timer by enable(), and their phase:
+ROBOT_PHASES = {'move': 'move', 'rotate': 'rotate', 'possible_tiles_after_move': 'sensor', 'observe': 'sensor'}
+
+_phases = {}
+_counters = Counter()
+# The data set aside by push(), restored by pop():
+_stack = []
+# (class, method name, original function) of every wrapped method:
+_wrapped = []
+# The profile of the current window, see start_profile:
+profiler = None
+
+
+class Phase:
+    """Call count, total and maximum time and a histogram of the durations of one phase."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, ns):
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+        self.buckets[min(ns.bit_length(), N_BUCKETS - 1)] += 1
+
+    def quantile(self, q):
+        """Upper bound (in ns) of the bucket the q-th quantile falls in."""
+        target, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** i, self.max_ns)
+        return self.max_ns
+
+    def to_dict(self):
+        return {'count': self.count, 'total_ns': self.total_ns, 'max_ns': self.max_ns, 'buckets': list(self.buckets)}
+
+    def merge(self, data):
+        self.count += data['count']
+        self.total_ns += data['total_ns']
+        self.max_ns = max(self.max_ns, data['max_ns'])
+        self.buckets = [a + b for a, b in zip(self.buckets, data['buckets'])]
+
+
+def get_phase(name):
+    if name not in _phases:
+        _phases[name] = Phase(name)
+    return _phases[name]
+
+
+class _Timer:
+    __slots__ = ('phase', 'started')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        self.phase.add(time.perf_counter_ns() - self.started)
+
+
+class _NoOp:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_OP = _NoOp()
+
+
+def phase(name):
+    """Context manager timing the block as phase name, a no-op while instrumentation is off."""
+    return _Timer(get_phase(name)) if enabled else _NO_OP
+
+
+def _timer_wrapper(function, name):
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        timer = get_phase(name)
+        started = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timer.add(time.perf_counter_ns() - started)
+    wrapper.__wrapped__ = function
+    wrapper.__name__, wrapper.__doc__ = function.__name__, function.__doc__
+    return wrapper
+
+
+def timed(name):
+    """Decorator timing every call of the function as phase name while instrumentation is on. Only for functions
+    that are called a few times per epoch or frame, the hot Robot methods are wrapped by enable() instead."""
+    return lambda function: _timer_wrapper(function, name)
+
+
+def count(name, n=1):
+    """Adds n to counter name, while instrumentation is on."""
+    if enabled:
+        _counters[name] += n
+
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    from environment import Robot
+    from fleet_environment import RobotView
+    for cls in (Robot, RobotView):
+        for method, name in ROBOT_PHASES.items():
+            # RobotView has no observe:
+            if method not in vars(cls):
+                continue
+            original = getattr(cls, method)
+            _wrapped.append((cls, method, original))
+            setattr(cls, method, _timer_wrapper(original, name))
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+    while _wrapped:
+        cls, method, original = _wrapped.pop()
+        setattr(cls, method, original)
+
+
+def reset():
+    _phases.clear()
+    _counters.clear()
+
+
+def push():
+    """Starts recording into fresh data, the data recorded so far is set aside until pop(). Lets a part of a run
+    (like a single episode) be recorded on its own, without clearing what was recorded or merged before it."""
+    global _phases, _counters
+    _stack.append((_phases, _counters))
+    _phases, _counters = {}, Counter()
+
+
+def pop():
+    """Returns a snapshot of the data recorded since the matching push(), and restores the data from before it."""
+    global _phases, _counters
+    data = snapshot()
+    _phases, _counters = _stack.pop()
+    return data
+
+
+def snapshot():
+    """All recorded data as a (picklable, JSON serializable) dict, see merge."""
+    return {'phases': {name: phase.to_dict() for name, phase in _phases.items()}, 'counters': dict(_counters)}
+
+
+def merge(data):
+    """Adds a snapshot, e.g. from a worker process, to the recorded data."""
+    for name, phase_data in data['phases'].items():
+        get_phase(name).merge(phase_data)
+    _counters.update(data['counters'])
+
+
+def summary():
+    """Table of the recorded phases and counters, for reports on the command line."""
+    lines = [f"{'phase':<14} {'calls':>10} {'total (s)':>10} {'mean (us)':>10} {'p50 (us)':>10} {'p99 (us)':>10} "
+             f"{'max (us)':>10}"]
+    for name, phase in sorted(_phases.items(), key=lambda item: -item[1].total_ns):
+        if phase.count:
+            lines.append(f'{name:<14} {phase.count:>10} {phase.total_ns / 1e9:>10.3f} '
+                         f'{phase.total_ns / phase.count / 1e3:>10.2f} {phase.quantile(0.5) / 1e3:>10.2f} '
+                         f'{phase.quantile(0.99) / 1e3:>10.2f} {phase.max_ns / 1e3:>10.2f}')
+    for name, n in sorted(_counters.items()):
+        lines.append(f'{name:<14} {n:>10}')
+    return '\n'.join(lines)
+
+
+def prometheus_text(prefix='simulation'):
+    """The recorded data in the Prometheus text format: a histogram (in seconds) per phase and the counters."""
+    lines = [f'# TYPE {prefix}_phase_seconds histogram']
+    for name, phase in sorted(_phases.items()):
+        cumulative = 0
+        for i, n in enumerate(phase.buckets[:-1]):
+            cumulative += n
+            lines.append(f'{prefix}_phase_seconds_bucket{{phase="{name}",le="{2 ** i / 1e9:.9g}"}} {cumulative}')
+        lines.append(f'{prefix}_phase_seconds_bucket{{phase="{name}",le="+Inf"}} {phase.count}')
+        lines.append(f'{prefix}_phase_seconds_sum{{phase="{name}"}} {phase.total_ns / 1e9:.9g}')
+        lines.append(f'{prefix}_phase_seconds_count{{phase="{name}"}} {phase.count}')
+    for name, n in sorted(_counters.items()):
+        lines.append(f'# TYPE {prefix}_{name}_total counter')
+        lines.append(f'{prefix}_{name}_total {n}')
+    return '\n'.join(lines) + '\n'
+
+
+class Profile:
+    """cProfile or sampling profile of the epochs start..start + n_epochs (counted by epoch_done, from the moment
+    the profile is created). The sampling profiler records the stack of the profiled thread every interval
+    seconds from a background thread, which keeps the overhead low but only works for the thread that calls
+    epoch_done when the window starts."""
+
+    def __init__(self, n_epochs, start=0, mode='cprofile', interval=0.001):
+        if mode not in ('cprofile', 'sample'):
+            raise ValueError(f"Unknown profile mode '{mode}', use 'cprofile' or 'sample'.")
+        self.n_epochs = n_epochs
+        self.start = start
+        self.mode = mode
+        self.interval = interval
+        self.epoch = 0
+        self.running = False
+        self.finished = False
+        self.profile = None
+        self.samples = Counter()
+        self.n_samples = 0
+
+    def epoch_done(self):
+        if self.epoch == self.start:
+            self._start()
+        self.epoch += 1
+        if self.epoch == self.start + self.n_epochs + 1:
+            self._stop()
+
+    def _start(self):
+        self.running = True
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            thread_id = threading.get_ident()
+            threading.Thread(target=self._sample, args=(thread_id,), daemon=True).start()
+
+    def _stop(self):
+        self.running = False
+        self.finished = True
+        if self.profile is not None:
+            self.profile.disable()
+
+    def _sample(self, thread_id):
+        while self.running:
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+                self.n_samples += 1
+            time.sleep(self.interval)
+
+    def report(self, limit=25):
+        """Text report: the cProfile stats sorted by cumulative time, or the functions that were on the stack in
+        the most samples."""
+        if self.mode == 'cprofile':
+            if self.profile is None:
+                return 'No epochs profiled yet.'
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+            return stream.getvalue()
+        inclusive, own = Counter(), Counter()
+        for stack, n in self.samples.items():
+            for function in set(stack):
+                inclusive[function] += n
+            own[stack[-1]] += n
+        lines = [f'{self.n_samples} samples', f"{'on stack':>9} {'own':>9}  function"]
+        for function, n in inclusive.most_common(limit):
+            lines.append(f'{n / max(self.n_samples, 1):>9.1%} {own[function] / max(self.n_samples, 1):>9.1%}  '
+                         f'{function}')
+        return '\n'.join(lines)
+
+
+def start_profile(n_epochs, start=0, mode='cprofile', interval=0.001):
+    """Profiles the epochs start..start + n_epochs from now, see Profile. Returns the profile, its report is
+    complete once profile.finished is True."""
+    global profiler
+    profiler = Profile(n_epochs, start, mode, interval)
+    return profiler
+
+
+def epoch_done():
+    """Called by the simulation loops after every epoch, moves the profile window along."""
+    if profiler is not None and not profiler.finished:
+        profiler.epoch_done()
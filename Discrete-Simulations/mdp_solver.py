@@ -0,0 +1,189 @@
+"""Planning with a model of the discrete environment.
+
+A Model compiles the cells of a Grid and the parameters of a Robot (p_move, battery drain) into a Markov decision
+process over the free tiles: the state is the position of the robot and the actions are the moves in the directions
+n, e, s, w. Rotating is free within an epoch, so the orientation does not have to be part of the state. The
+transitions are stored sparsely: a move ends up on the neighbour in the direction of the action (or stays, if that
+is blocked), or with probability p_move on a random free neighbour, which is the same for every action. So only the
+4 neighbours of every state are stored, and a sweep over all states and actions is a gather of the values of the
+neighbours and a few array operations. Arrays over states and actions have the actions first, (4, n_states), which
+keeps the reductions over the actions fast:
+    model = Model(grid.cells, p_move=0.2)
+    values, policy, n_iterations = value_iteration(model)
+    actions = model.action_map(policy)  # direction of every tile, indexes DIRECTIONS
+"""
+import numpy as np
+
+from environment import DIRECTIONS
+
+# Reward for entering a tile, by tile value (clean, dirty, goal, death), a move that fails gets the clean reward:
+REWARDS = {0: -0.1, 1: 1.0, 2: 2.0, 3: -10.0}
+
+
+class Model:
+    """Transition model of a robot on the given cells. Tiles with a robot on them count as clean.
+    The battery is not part of the state: draining is modelled as a chance of battery_drain_p * battery_drain_lam
+    / 100 per move of the episode ending (the mean drain per move relative to a full battery), which acts as extra
+    discounting. Death tiles end the episode as well."""
+
+    def __init__(self, cells, p_move=0, battery_drain_p=0, battery_drain_lam=0, rewards=None, gamma=0.99):
+        robot = cells <= -3
+        free = (cells >= 0) | robot
+        self.shape = cells.shape
+        flat = np.flatnonzero(free)
+        self.n_states = len(flat)
+        # State of every tile, -1 for walls and obstacles:
+        self.index = np.full(cells.shape, -1, dtype=np.int32)
+        self.index.flat[flat] = np.arange(self.n_states, dtype=np.int32)
+        self.positions = np.stack(np.unravel_index(flat, cells.shape), axis=1)
+        self.tiles = np.where(robot, 0, cells).ravel()[flat].astype(np.int8)
+        self.rewards = dict(REWARDS, **(rewards or {}))
+        self.discount = gamma * (1 - min(1, battery_drain_p * battery_drain_lam / 100))
+
+        self.p_move = p_move
+        # Neighbouring state in every direction, the state itself if the neighbour is blocked:
+        own = np.arange(self.n_states, dtype=np.int32)
+        self.neighbours = neighbours = np.empty((4, self.n_states), dtype=np.int32)
+        for k, (dx, dy) in enumerate(DIRECTIONS):
+            x, y = self.positions[:, 0] + dx, self.positions[:, 1] + dy
+            inside = (x >= 0) & (x < cells.shape[0]) & (y >= 0) & (y < cells.shape[1])
+            neighbour = np.full(self.n_states, -1, dtype=np.int32)
+            neighbour[inside] = self.index[x[inside], y[inside]]
+            neighbours[k] = np.where(neighbour >= 0, neighbour, own)
+        free_neighbours = neighbours != own
+        n_free = free_neighbours.sum(axis=0)
+        # Probability of a random move to every neighbour:
+        self.random_prob = np.where(free_neighbours, p_move / np.maximum(n_free, 1), 0)
+        # Without a free neighbour a random move fails, and the robot stays (all neighbours are the state itself):
+        self.random_prob[0, n_free == 0] = p_move
+        self.update_rewards()
+
+    def update_rewards(self):
+        """Recomputes the expected reward of every state and action, needed after changing tiles or rewards."""
+        table = np.array([self.rewards[value] for value in range(4)])
+        entered = table[self.tiles][self.neighbours]
+        entered[self.neighbours == np.arange(self.n_states)] = self.rewards[0]
+        self.expected_reward = (1 - self.p_move) * entered + (self.random_prob * entered).sum(axis=0)
+        # The episode ends on death tiles, so their value never counts:
+        self.continues = (self.tiles != 3).astype(float)
+
+    def set_tiles(self, positions, value):
+        """Changes the value of the tiles at positions (e.g. to 0 after cleaning them)."""
+        positions = np.asarray(positions).reshape(-1, 2)
+        self.tiles[self.index[positions[:, 0], positions[:, 1]]] = value
+        self.update_rewards()
+
+    def future_values(self, values):
+        """Discounted values of the neighbours of every state, and of a random move."""
+        future = (self.discount * self.continues * values)[self.neighbours]
+        return future, (self.random_prob * future).sum(axis=0)
+
+    def q_values(self, values):
+        """(4, n_states) expected return of every action, given the values of the states."""
+        future, random_move = self.future_values(values)
+        return self.expected_reward + (1 - self.p_move) * future + random_move
+
+    def action_map(self, policy):
+        """The policy as a (n_cols, n_rows) int8 array of directions (indexes of DIRECTIONS), -1 for blocked tiles,
+        so the action at a position is a single lookup."""
+        actions = np.full(self.shape, -1, dtype=np.int8)
+        actions[self.positions[:, 0], self.positions[:, 1]] = policy
+        return actions
+
+
+def value_iteration(model, tol=1e-3, max_iterations=10000, values=None):
+    """Value iteration until no value changes more than tol. values are the initial values, e.g. of a previous
+    solution to warm start from. Returns the values, the greedy policy and the number of iterations."""
+    values = np.zeros(model.n_states) if values is None else np.array(values, dtype=float)
+    q = model.q_values(values)
+    for iteration in range(1, max_iterations + 1):
+        new_values = q.max(axis=0)
+        delta = np.abs(new_values - values).max(initial=0)
+        values = new_values
+        q = model.q_values(values)
+        if delta < tol:
+            break
+    return values, q.argmax(axis=0), iteration
+
+
+def evaluate_policy(model, policy, tol=1e-3, max_iterations=10000, values=None):
+    """Values of following policy, by iterating over the transitions of the chosen actions only."""
+    values = np.zeros(model.n_states) if values is None else np.array(values, dtype=float)
+    rows = np.arange(model.n_states)
+    reward = model.expected_reward[policy, rows]
+    for iteration in range(max_iterations):
+        future, random_move = model.future_values(values)
+        new_values = reward + (1 - model.p_move) * future[policy, rows] + random_move
+        delta = np.abs(new_values - values).max(initial=0)
+        values = new_values
+        if delta < tol:
+            break
+    return values
+
+
+def policy_iteration(model, tol=1e-3, max_iterations=1000, eval_iterations=50, values=None, policy=None):
+    """Modified policy iteration: every policy is evaluated with at most eval_iterations sweeps over the transitions
+    of its actions (cheaper than a sweep over all actions), starting from the values of the previous policy. An
+    action is only replaced by one that is more than tol better, and the iteration stops when the policy is stable
+    and no value is more than tol off from its Bellman update. Returns the values, the policy and the number of
+    iterations."""
+    values = np.zeros(model.n_states) if values is None else np.array(values, dtype=float)
+    if policy is None:
+        policy = model.q_values(values).argmax(axis=0)
+    rows = np.arange(model.n_states)
+    for iteration in range(1, max_iterations + 1):
+        values = evaluate_policy(model, policy, tol, eval_iterations, values)
+        q = model.q_values(values)
+        best = q.max(axis=0)
+        new_policy = np.where(q[policy, rows] >= best - tol, policy, q.argmax(axis=0))
+        if np.array_equal(new_policy, policy) and np.abs(best - values).max(initial=0) < tol:
+            break
+        policy = new_policy
+    return values, policy, iteration
+
+
+class Planner:
+    """Follows the optimal policy of a model. The model does not know which tiles get cleaned, so the planner keeps
+    track of the dirty tiles the robot visited since the last solution, and solves again (warm started from the
+    previous values) once the policy wants to move onto one of those."""
+
+    def __init__(self, model, tol=1e-3, max_iterations=10000):
+        self.model = model
+        self.tol = tol
+        self.max_iterations = max_iterations
+        self.values, policy, self.n_iterations = value_iteration(model, tol, max_iterations)
+        self.actions = model.action_map(policy)
+        self.n_solves = 1
+        # Tiles with a reward in the model that have been cleaned since:
+        self.collected = set()
+
+    def solve(self):
+        self.model.set_tiles(list(self.collected), 0)
+        self.collected.clear()
+        self.values, policy, n_iterations = value_iteration(self.model, self.tol, self.max_iterations, self.values)
+        self.actions = self.model.action_map(policy)
+        self.n_iterations += n_iterations
+        self.n_solves += 1
+
+    def observe(self, pos, tiles):
+        """Tells the planner what the robot sees, tiles as returned by possible_tiles_after_move. Tiles that are
+        dirty in the model but seen clean (cleaned by other robots) count as visited."""
+        tiles_of = self.model.tiles
+        for (dx, dy), value in tiles.items():
+            state = self.model.index.item(pos[0] + dx, pos[1] + dy) if value == 0 else -1
+            if state >= 0 and tiles_of.item(state) in (1, 2):
+                self.collected.add((pos[0] + dx, pos[1] + dy))
+
+    def next_move(self, pos):
+        """Direction (index of DIRECTIONS) to move in from pos, -1 if pos is not a free tile of the model."""
+        state = self.model.index.item(pos)
+        # The tile we are on will be clean when we leave it:
+        if state >= 0 and self.model.tiles.item(state) in (1, 2):
+            self.collected.add(pos)
+        action = self.actions.item(pos)
+        if action >= 0 and self.collected:
+            dx, dy = DIRECTIONS[action]
+            if (pos[0] + dx, pos[1] + dy) in self.collected:
+                self.solve()
+                action = self.actions.item(pos)
+        return action
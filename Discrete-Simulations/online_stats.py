@@ -0,0 +1,161 @@
+"""Statistics that are updated one value at a time, in O(1) memory, for evaluating robots on streams of episodes."""
+import bisect
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+
+def z_value(confidence):
+    """The z value of a two sided normal confidence interval, e.g. 1.96 for a confidence of 0.95."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_halfwidth(successes, n, z):
+    """Half the width of the Wilson score interval of a proportion. Unlike the normal interval it does not collapse
+    to zero when all (or none) of the trials succeeded."""
+    if n == 0:
+        return math.inf
+    p = successes / n
+    return z / (1 + z ** 2 / n) * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+
+
+class Welford:
+    """Running mean and variance, with Welford's algorithm (numerically stable in a single pass)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        """Adds the values of another Welford (Chan et al.'s pairwise update)."""
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self):
+        """The sample variance."""
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def halfwidth(self, z):
+        """Half the width of the normal confidence interval of the mean."""
+        if self.n < 2:
+            return math.inf
+        return z * self.std / math.sqrt(self.n)
+
+
+class P2Quantile:
+    """Streaming estimate of the q-quantile with the P-square algorithm (Jain and Chlamtac, 1985): five markers
+    track the minimum, the q/2, q and (1 + q)/2 quantiles and the maximum, and are moved along with a piecewise
+    parabolic fit as values arrive."""
+
+    def __init__(self, q):
+        self.q = q
+        self.n = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def add(self, x):
+        self.n += 1
+        heights, positions = self.heights, self.positions
+        if self.n <= 5:
+            bisect.insort(heights, x)
+            return
+        # Find the cell the value falls in, extending the extremes:
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(heights, x) - 1
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        # Move the middle markers that are off from their desired position by a step:
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        h, n = self.heights, self.positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                                                  + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self):
+        if self.n == 0:
+            return math.nan
+        if self.n <= 5:
+            # Exact, from the few values seen so far:
+            return self.heights[round(self.q * (self.n - 1))]
+        return self.heights[2]
+
+
+class Histogram:
+    """Counts of values in fixed bins between low and high, values outside are counted in the first or last bin."""
+
+    def __init__(self, low, high, n_bins):
+        self.edges = np.linspace(low, high, n_bins + 1)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+
+    def add(self, x):
+        self.counts[min(max(np.searchsorted(self.edges, x, side='right') - 1, 0), len(self.counts) - 1)] += 1
+
+
+class MetricStats:
+    """Mean, variance, a few quantiles and optionally a histogram of a stream of values of a single metric."""
+    QUANTILES = (0.1, 0.5, 0.9)
+
+    def __init__(self, histogram=None):
+        self.moments = Welford()
+        self.quantiles = {q: P2Quantile(q) for q in self.QUANTILES}
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.histogram = histogram
+
+    def add(self, x):
+        self.moments.add(x)
+        for quantile in self.quantiles.values():
+            quantile.add(x)
+        self.minimum = min(self.minimum, x)
+        self.maximum = max(self.maximum, x)
+        if self.histogram is not None:
+            self.histogram.add(x)
+
+    @property
+    def n(self):
+        return self.moments.n
+
+    @property
+    def mean(self):
+        return self.moments.mean
+
+    def quantile(self, q):
+        return self.quantiles[q].value
@@ -0,0 +1,273 @@
+"""Recordings of episodes, for replaying them afterwards without simulating them again.
+
+A .rec file holds the grid and robots at the start of an episode, a compact stream of the events of every epoch and
+a keyframe (a copy of all cells and robot states) every keyframe_interval epochs, so the state after any epoch can
+be reconstructed from the nearest keyframe before it. All sections start at a multiple of 8 bytes and the file is
+memory-mapped when read. Layout (little endian):
+    header     HEADER_SIZE bytes: magic b'DICREC\0\0', version uint16, n_cols uint32, n_rows uint32, n_robots uint16,
+               keyframe_interval uint32
+    keyframe   the cells (int8, like a .bgrid file, padded to 8 bytes) and an array of ROBOT_STATE, one per robot
+    events     EVENT records of epoch 1, 2, ..., with a keyframe after every keyframe_interval epochs
+    index      an EPOCH_INDEX per epoch, a KEYFRAME_INDEX per keyframe and the metadata as JSON
+    trailer    magic b'DICRIDX\0', n_epochs uint64, n_keyframes uint64, index offset uint64, metadata size uint64
+A recording without a trailer was not closed (the episode crashed) and can't be read.
+Print a summary of recordings with:
+    python recording.py recordings/*.rec
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from environment import ORIENTATIONS, Grid, RobotStats
+
+RECORDING_EXTENSION = '.rec'
+MAGIC = b'DICREC\0\0'
+INDEX_MAGIC = b'DICRIDX\0'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHIIHI')
+HEADER_SIZE = 32
+TRAILER = struct.Struct('<8sQQQQ')
+
+# Event kinds, an event is a cell change or a change of the state of a robot during an epoch:
+CELL, MOVE, REVISIT, ROTATE, BATTERY, DEATH = range(6)
+# value is the new cell value (CELL), the number of moves (MOVE, x and y are the new position), the number of moves
+# to already visited tiles (REVISIT), the orientation as a cell value (ROTATE) or the battery level in hundredths of
+# a percent (BATTERY):
+EVENT = np.dtype([('kind', 'u1'), ('robot', 'u1'), ('value', '<i2'), ('x', '<u2'), ('y', '<u2')])
+EVENT_STRUCT = struct.Struct('<BBhHH')
+ROBOT_STATE = np.dtype([('x', '<u2'), ('y', '<u2'), ('orientation', 'i1'), ('alive', 'u1'), ('battery', '<i2'),
+                        ('n_moves', '<i4'), ('n_revisited', '<i4')])
+EPOCH_INDEX = np.dtype([('offset', '<i8'), ('n_events', '<i8')])
+KEYFRAME_INDEX = np.dtype([('epoch', '<i8'), ('offset', '<i8')])
+
+
+def _padded(size):
+    return (size + 7) // 8 * 8
+
+
+def _last(keys):
+    """Indices of the last occurrence of every distinct key."""
+    _, first = np.unique(keys[::-1], return_index=True)
+    return len(keys) - 1 - first
+
+
+def robot_state(robot):
+    """The state of a robot as a tuple with the fields of ROBOT_STATE."""
+    return (robot.pos[0], robot.pos[1], -3 - ORIENTATIONS.index(robot.orientation), int(robot.alive),
+            max(0, round(float(robot.battery_lvl) * 100)), robot.stats.n_moves, robot.stats.n_revisited)
+
+
+def apply_events(cells, states, events):
+    """Applies the events of one or more consecutive epochs to the cells and robot states, in place."""
+    kind = events['kind']
+    changed = events[kind == CELL]
+    if len(changed):
+        # Only the last value of every cell counts:
+        last = _last(changed['x'].astype(np.int64) * cells.shape[1] + changed['y'])
+        cells[changed['x'][last], changed['y'][last]] = changed['value'][last]
+    moves = events[kind == MOVE]
+    np.add.at(states['n_moves'], moves['robot'], moves['value'])
+    last = _last(moves['robot'])
+    states['x'][moves['robot'][last]] = moves['x'][last]
+    states['y'][moves['robot'][last]] = moves['y'][last]
+    revisits = events[kind == REVISIT]
+    np.add.at(states['n_revisited'], revisits['robot'], revisits['value'])
+    for event_kind, field in ((ROTATE, 'orientation'), (BATTERY, 'battery')):
+        selected = events[kind == event_kind]
+        last = _last(selected['robot'])
+        states[field][selected['robot'][last]] = selected['value'][last]
+    states['alive'][events['robot'][kind == DEATH]] = 0
+
+
+class Recorder:
+    """Writes a recording of the robots on a grid. Call epoch() after every epoch and close() at the end, or use it as
+    a context manager. The recorder takes over the change record of the grid (see Grid.track_changes), the cell
+    changes of an epoch are read from it."""
+
+    def __init__(self, path, grid, robots, keyframe_interval=100, meta=None):
+        self.grid = grid
+        self.robots = robots
+        self.keyframe_interval = keyframe_interval
+        # Written to the index when the recording is closed, add the results of the episode before that:
+        self.meta = dict(meta or {})
+        self.file = open(path, 'wb')
+        self.offset = 0
+        self._write(HEADER.pack(MAGIC, FORMAT_VERSION, grid.n_cols, grid.n_rows, len(robots),
+                                keyframe_interval).ljust(HEADER_SIZE, b'\0'))
+        self.epochs = []
+        self.keyframes = []
+        # The robot states the next events are relative to:
+        self.states = [robot_state(robot) for robot in robots]
+        grid.track_changes()
+        self._keyframe()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, data):
+        self.file.write(data)
+        self.offset += len(data)
+
+    def _keyframe(self):
+        self.keyframes.append((len(self.epochs), self.offset))
+        cells = np.ascontiguousarray(self.grid.cells, dtype=np.int8).tobytes()
+        self._write(cells.ljust(_padded(len(cells)), b'\0'))
+        self._write(np.array(self.states, dtype=ROBOT_STATE).tobytes())
+
+    def epoch(self):
+        """Records the changes since the previous epoch."""
+        # Packed one by one, for the few events of an epoch that is faster than building an array:
+        pack = EVENT_STRUCT.pack
+        events = [pack(CELL, 0, value, x, y) for x, y, value in self.grid.pop_changes()]
+        states = [robot_state(robot) for robot in self.robots]
+        for i, (old, new) in enumerate(zip(self.states, states)):
+            if new == old:
+                continue
+            x, y, orientation, alive, battery, n_moves, n_revisited = new
+            if n_moves != old[5] or (x, y) != old[:2]:
+                events.append(pack(MOVE, i, n_moves - old[5], x, y))
+            if n_revisited != old[6]:
+                events.append(pack(REVISIT, i, n_revisited - old[6], x, y))
+            if orientation != old[2]:
+                events.append(pack(ROTATE, i, orientation, x, y))
+            if battery != old[4]:
+                events.append(pack(BATTERY, i, battery, x, y))
+            if alive != old[3]:
+                events.append(pack(DEATH, i, 0, x, y))
+        self.epochs.append((self.offset, len(events)))
+        self._write(b''.join(events))
+        self.states = states
+        if len(self.epochs) % self.keyframe_interval == 0:
+            self._keyframe()
+
+    def close(self):
+        """Writes the index and closes the file, the grid stops recording its changes."""
+        if self.file.closed:
+            return
+        index_offset = self.offset
+        self._write(np.array(self.epochs, dtype=EPOCH_INDEX).tobytes())
+        self._write(np.array(self.keyframes, dtype=KEYFRAME_INDEX).tobytes())
+        meta = json.dumps(self.meta).encode()
+        self._write(meta)
+        self._write(TRAILER.pack(INDEX_MAGIC, len(self.epochs), len(self.keyframes), index_offset, len(meta)))
+        self.file.close()
+        self.grid.changes = None
+
+
+class Recording:
+    """A recording, memory-mapped read-only. Nothing but the index is read until state() is called."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, self.n_cols, self.n_rows, self.n_robots, self.keyframe_interval = HEADER.unpack(
+            self.data[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a recording!')
+        if version > FORMAT_VERSION:
+            raise ValueError(f'{path} has recording format version {version}, only versions up to {FORMAT_VERSION} '
+                             f'are known!')
+        magic, n_epochs, n_keyframes, index_offset, meta_size = TRAILER.unpack(self.data[-TRAILER.size:].tobytes())
+        if magic != INDEX_MAGIC:
+            raise ValueError(f'{path} is not a finished recording!')
+        self.n_epochs = n_epochs
+        self.epochs = self._array(index_offset, EPOCH_INDEX, n_epochs)
+        self.keyframes = self._array(index_offset + EPOCH_INDEX.itemsize * n_epochs, KEYFRAME_INDEX, n_keyframes)
+        meta_offset = index_offset + EPOCH_INDEX.itemsize * n_epochs + KEYFRAME_INDEX.itemsize * n_keyframes
+        self.meta = json.loads(self.data[meta_offset:meta_offset + meta_size].tobytes())
+
+    def _array(self, offset, dtype, count):
+        return self.data[offset:offset + count * dtype.itemsize].view(dtype)
+
+    def keyframe(self, k):
+        """Returns the epoch, cells and robot states of keyframe k, as read-only views of the file."""
+        epoch, offset = self.keyframes[k].tolist()
+        cells = self.data[offset:offset + self.n_cols * self.n_rows].view(np.int8).reshape(self.n_cols, self.n_rows)
+        states = self._array(offset + _padded(self.n_cols * self.n_rows), ROBOT_STATE, self.n_robots)
+        return epoch, cells, states
+
+    def events(self, first, last):
+        """The events of the epochs first up to and including last, which must not have a keyframe in between."""
+        if last < first:
+            return np.empty(0, dtype=EVENT)
+        start = int(self.epochs['offset'][first - 1])
+        end = int(self.epochs['offset'][last - 1] + EVENT.itemsize * self.epochs['n_events'][last - 1])
+        return self._array(start, EVENT, (end - start) // EVENT.itemsize)
+
+    def state(self, epoch):
+        """Returns new arrays of the cells and robot states after the given epoch, 0 is the start of the episode."""
+        if not 0 <= epoch <= self.n_epochs:
+            raise IndexError(f'Epoch {epoch} is not in the recording (0 to {self.n_epochs}).')
+        k = np.searchsorted(self.keyframes['epoch'], epoch, side='right') - 1
+        keyframe_epoch, cells, states = self.keyframe(k)
+        cells, states = np.array(cells), np.array(states)
+        apply_events(cells, states, self.events(keyframe_epoch + 1, epoch))
+        return cells, states
+
+
+class ReplayRobot:
+    """A recorded robot at the current epoch of a replay, with the attributes of a Robot that are shown in the
+    browser."""
+
+    def __init__(self, grid, state):
+        self.grid = grid
+        self.pos = (int(state['x']), int(state['y']))
+        self.orientation = ORIENTATIONS[-3 - int(state['orientation'])]
+        self.alive = bool(state['alive'])
+        self.battery_lvl = int(state['battery']) / 100
+        self.stats = RobotStats()
+        self.stats.n_moves = int(state['n_moves'])
+        self.stats.n_revisited = int(state['n_revisited'])
+
+    @property
+    def efficiency(self):
+        n_total_tiles = self.grid.stats.visitable
+        return (100 * n_total_tiles) / (n_total_tiles + self.stats.n_revisited)
+
+
+class Replay:
+    """Playback of a recording, with the grid at the current epoch. Seeking changes the cells of the grid through
+    set_cells, so the cells that changed can be sent to the browser with grid.pop_changes()."""
+
+    def __init__(self, path):
+        self.recording = Recording(path)
+        self.epoch = 0
+        cells, states = self.recording.state(0)
+        self.grid = Grid.from_cells(cells)
+        self.grid.track_changes()
+        self.robots = [ReplayRobot(self.grid, state) for state in states]
+
+    def seek(self, epoch):
+        """Moves to the given epoch (clipped to the recording), forwards or backwards."""
+        epoch = min(max(epoch, 0), self.recording.n_epochs)
+        cells, states = self.recording.state(epoch)
+        xs, ys = np.nonzero(cells != self.grid.cells)
+        if len(xs):
+            self.grid.set_cells(xs, ys, cells[xs, ys])
+        self.robots = [ReplayRobot(self.grid, state) for state in states]
+        self.epoch = epoch
+
+
+def list_recordings(folder):
+    """The paths of the recordings in a folder and its subfolders, relative to the folder."""
+    paths = []
+    for root, folders, files in os.walk(folder):
+        paths.extend(os.path.relpath(os.path.join(root, file), folder) for file in files
+                     if file.endswith(RECORDING_EXTENSION))
+    return sorted(paths)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print a summary of recordings.')
+    parser.add_argument('files', nargs='+', help='recording files')
+    for file in parser.parse_args().files:
+        recording = Recording(file)
+        result = recording.meta.get('result', {})
+        print(f"{file}: {recording.n_epochs} epochs, {os.path.getsize(file)} bytes, "
+              + ', '.join(f'{name} {value}' for name, value in result.items()))
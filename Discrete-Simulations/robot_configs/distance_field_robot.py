@@ -0,0 +1,186 @@
+import heapq
+
+import numpy as np
+
+# Values in the map of the robot, next to the tile values it observed:
+UNKNOWN = -7
+OUTSIDE = -1
+INF = np.iinfo(np.int32).max
+
+
+def is_target(value):
+    """Tiles the robot wants to visit: dirty tiles, goals and tiles it has not seen yet."""
+    return value == 1 or value == 2 or value == UNKNOWN
+
+
+class DistanceField:
+    """Map of the tiles a robot observed, with the distance (in moves) from every tile to the nearest target.
+    The distances are repaired locally when tiles change, instead of being recomputed with a BFS over the whole map:
+    targets that are cleaned and tiles that turn out to be blocked raise the distances of the tiles that depended on
+    them (and only those), after which the raised tiles and new targets are settled with a Dijkstra search that stops
+    where the distances stay the same.
+    Tiles are stored in flat arrays with a border of OUTSIDE tiles around the map, so neighbours are just index
+    offsets. The robot does not know the size of the room, the map starts small and grows (see grow) with the tiles
+    it sees, always one tile beyond the known ones, so the border never touches a tile the robot knows."""
+
+    def __init__(self, shape=(1, 1)):
+        self._allocate(shape)
+        # Every tile is unknown, so a target, at the start:
+        self.dist = np.where(self.known == UNKNOWN, 0, INF).astype(np.int32)
+
+    def _allocate(self, shape):
+        n_cols, n_rows = self.shape = shape
+        self.stride = n_rows + 2
+        known = np.full((n_cols + 2, n_rows + 2), UNKNOWN, dtype=np.int8)
+        known[0, :] = known[-1, :] = OUTSIDE
+        known[:, 0] = known[:, -1] = OUTSIDE
+        self.known = known.ravel()
+        self.offsets = (-1, 1, -self.stride, self.stride)
+
+    def grow(self, x, y):
+        """Makes sure tile (x, y) and its neighbours are on the map. The map at least doubles in size when it
+        grows, after which the distances are computed from scratch, so this only happens a few times."""
+        n_cols, n_rows = self.shape
+        if x + 1 < n_cols and y + 1 < n_rows:
+            return
+        old = self.known.reshape(n_cols + 2, n_rows + 2)[1:-1, 1:-1]
+        self._allocate((max(x + 2, 2 * n_cols) if x + 1 >= n_cols else n_cols,
+                        max(y + 2, 2 * n_rows) if y + 1 >= n_rows else n_rows))
+        self.known.reshape(self.shape[0] + 2, self.shape[1] + 2)[1:n_cols + 1, 1:n_rows + 1] = old
+        known = self.known
+        self.dist = np.full(len(known), INF, dtype=np.int32)
+        self._lower(np.flatnonzero((known == 1) | (known == 2) | (known == UNKNOWN)).tolist())
+
+    def index(self, pos):
+        return (pos[0] + 1) * self.stride + pos[1] + 1
+
+    def update(self, observations):
+        """Enters observed tiles ((index, value) pairs) into the map and repairs the distances."""
+        known = self.known
+        raised, lowered = [], []
+        for i, value in observations:
+            old = known.item(i)
+            if value == old:
+                continue
+            known[i] = value
+            if is_target(value):
+                lowered.append(i)
+            elif value < 0 or is_target(old):
+                # Blocked tiles and tiles that are no longer a target can only make paths longer:
+                raised.append(i)
+            else:
+                # A blocked tile that is free again:
+                lowered.append(i)
+        if raised:
+            lowered.extend(self._raise(raised))
+        if lowered:
+            self._lower(lowered)
+
+    def _raise(self, seeds):
+        """Sets the distance of the seeds and of every tile whose shortest path went through them to INF, returns
+        those tiles. Tiles are handled in the order of their old distance, so all tiles at distance d that lost their
+        path are known before the tiles at distance d + 1 look for another neighbour at distance d."""
+        dist, offsets = self.dist, self.offsets
+        heap = []
+        for i in seeds:
+            d = dist.item(i)
+            if d != INF:
+                dist[i] = INF
+                heap.append((d, i))
+        heapq.heapify(heap)
+        invalidated = [i for d, i in heap]
+        while heap:
+            d, i = heapq.heappop(heap)
+            for step in offsets:
+                j = i + step
+                if dist.item(j) != d + 1:
+                    continue
+                # Keep the distance of j if it has another neighbour at distance d:
+                if any(dist.item(j + other) == d for other in offsets):
+                    continue
+                dist[j] = INF
+                invalidated.append(j)
+                heapq.heappush(heap, (d + 1, j))
+        return invalidated
+
+    def _lower(self, seeds):
+        """Settles the distances from the seeds outwards, as far as they get shorter."""
+        known, dist, offsets = self.known, self.dist, self.offsets
+        heap = []
+        for i in seeds:
+            value = known.item(i)
+            if is_target(value):
+                d = 0
+            elif value < 0:
+                continue
+            else:
+                d = min(dist.item(i + step) for step in offsets)
+                d = INF if d == INF else d + 1
+            if d < dist.item(i):
+                dist[i] = d
+            if dist.item(i) != INF:
+                heap.append((dist.item(i), i))
+        heapq.heapify(heap)
+        while heap:
+            d, i = heapq.heappop(heap)
+            if d != dist.item(i):
+                continue
+            for step in offsets:
+                j = i + step
+                # Only free tiles carry paths, targets are at distance 0 already:
+                if d + 1 < dist.item(j) and known.item(j) >= 0:
+                    dist[j] = d + 1
+                    heapq.heappush(heap, (d + 1, j))
+
+    def observe(self, robot):
+        """Enters what the robot sees from its current position into the map."""
+        x, y = robot.pos
+        tiles = robot.possible_tiles_after_move()
+        # Make room on the map for what we see:
+        self.grow(max([x] + [x + dx for dx, dy in tiles]), max([y] + [y + dy for dx, dy in tiles]))
+        here = self.index(robot.pos)
+        # The tile we are on is clean as soon as we leave it:
+        observations = [(here, 0)]
+        for (dx, dy), value in tiles.items():
+            observations.append((here + dx * self.stride + dy, value))
+        self.update(observations)
+
+    def next_move(self, robot):
+        """The orientation of the neighbouring tile closest to a target, preferring the current orientation, or None
+        if no target can be reached."""
+        here = self.index(robot.pos)
+        best, best_dist = None, INF
+        orientations = [robot.orientation] + [orientation for orientation in robot.dirs
+                                              if orientation != robot.orientation]
+        for orientation in orientations:
+            dx, dy = robot.dirs[orientation]
+            j = here + dx * self.stride + dy
+            value = self.known.item(j)
+            if value < 0 and value != UNKNOWN:
+                continue
+            if self.dist.item(j) < best_dist:
+                best, best_dist = orientation, self.dist.item(j)
+        return best
+
+
+def robot_epoch(robot):
+    # The map is kept on the robot, the first epoch starts with an unknown room that grows as we see more of it:
+    planner = getattr(robot, 'planner', None)
+    if planner is None:
+        planner = robot.planner = DistanceField()
+    # Update the map and the distances with what we see now:
+    planner.observe(robot)
+    new_orient = planner.next_move(robot)
+    # Nothing left to clean that we can reach:
+    if new_orient is None:
+        return
+    # Orient ourselves towards the tile, rotating left if that is shorter:
+    orientations = list(robot.dirs.keys())
+    turns = (orientations.index(new_orient) - orientations.index(robot.orientation)) % 4
+    if turns == 3:
+        robot.rotate('l')
+    else:
+        for k in range(turns):
+            robot.rotate('r')
+    # Move:
+    robot.move()
@@ -1,4 +1,4 @@
-import random
+import numpy as np
 
 
 def robot_epoch(robot):
@@ -32,10 +32,10 @@ def robot_epoch(robot):
             # Check if we died to avoid endless looping:
             if not robot.alive:
                 break
-            # Decide randomly how often we want to rotate:
-            times = random.randrange(1, 4)
+            # Decide randomly how often we want to rotate (with the robot's own random numbers):
+            times = robot.random.randrange(1, 4)
             # Decide randomly in which direction we rotate:
-            if random.randrange(0, 2) == 0:
+            if robot.random.randrange(0, 2) == 0:
                 # print(f'Rotating right, {times} times.')
                 for k in range(times):
                     robot.rotate('r')
@@ -44,3 +44,26 @@ def robot_epoch(robot):
                 for k in range(times):
                     robot.rotate('l')
     #print('Historic coordinates:', [(x, y) for (x, y) in zip(robot.history[0], robot.history[1])])
+
+
+def robot_epoch_batched(robots):
+    """Same algorithm as robot_epoch, for a BatchedRobot running many episodes in lockstep."""
+    # Only look at the tiles that are one step away:
+    tiles = robots.possible_tiles_after_move()[0][:, :, 0]
+    goals = tiles == 2
+    dirty = tiles == 1
+    # Robots that can reach a goal or dirty tile this move, goals first:
+    seeking = goals.any(axis=1) | dirty.any(axis=1)
+    target = np.where(goals.any(axis=1), goals.argmax(axis=1), dirty.argmax(axis=1))
+    # Orient ourselves towards the tile and move:
+    robots.rotate((target - robots.orientation) % 4, mask=seeking)
+    robots.move(mask=seeking)
+    # The others move forward, rotating randomly until they can move:
+    wandering = ~seeking
+    while True:
+        wandering &= ~robots.move(mask=wandering) & robots.alive & robots.active
+        if not wandering.any():
+            break
+        # Decide randomly how often and in which direction we want to rotate:
+        times = robots.rng.integers(1, 4, len(wandering))
+        robots.rotate(np.where(robots.rng.integers(0, 2, len(wandering)) == 0, times, -times), mask=wandering)
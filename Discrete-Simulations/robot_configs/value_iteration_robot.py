@@ -0,0 +1,42 @@
+"""Follows the policy of a model of the whole room, solved with value iteration.
+
+Unlike the other algorithms this one plans on the map of the room it is handed at the start (robot.floor_plan(),
+which shows death tiles as dirty). After that it only learns about changes (tiles cleaned by other robots) through
+possible_tiles_after_move().
+"""
+from environment import ORIENTATIONS
+from mdp_solver import Model, Planner
+
+
+def robot_epoch(robot):
+    # Solve the model of the room once, the planner solves it again when it learns that it got stale:
+    planner = getattr(robot, 'planner', None)
+    if planner is None:
+        # The map of the room, see the module docstring:
+        model = Model(robot.floor_plan(), p_move=robot.p_move, battery_drain_p=robot.battery_drain_p,
+                      battery_drain_lam=robot.battery_drain_lam)
+        planner = robot.planner = Planner(model)
+    # Tiles that other robots cleaned make the model stale as well:
+    possible_tiles = robot.possible_tiles_after_move()
+    planner.observe(robot.pos, possible_tiles)
+    # Look up the move of the policy at our position:
+    action = planner.next_move(robot.pos)
+    if action < 0:
+        return
+    new_orient = ORIENTATIONS[action]
+    # If another robot is in the way, move to a random free tile instead:
+    move = robot.dirs[new_orient]
+    if possible_tiles.get(move, -1) < -2:
+        free = [orientation for orientation in ORIENTATIONS if possible_tiles.get(robot.dirs[orientation], -1) >= 0]
+        if not free:
+            return
+        new_orient = robot.random.choice(free)
+    # Orient ourselves towards the tile, rotating left if that is shorter:
+    turns = (ORIENTATIONS.index(new_orient) - ORIENTATIONS.index(robot.orientation)) % 4
+    if turns == 3:
+        robot.rotate('l')
+    else:
+        for k in range(turns):
+            robot.rotate('r')
+    # Move:
+    robot.move()
@@ -0,0 +1,107 @@
+import importlib.util
+import os
+import sys
+import threading
+
+ROBOT_CONFIGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'robot_configs')
+
+
+def find_cheats(source):
+    """Static check of a robot algorithm: robots have to use possible_tiles_after_move() (or floor_plan(), for
+    planners that are handed the map of the room) instead of looking at the grid, so any line mentioning the grid is an
+    error. Returns the error messages."""
+    return [f'Illegal access of grid by robot algorithm in line {i + 1}!\n use possible_tiles_after_move() instead!'
+            for i, line in enumerate(source.split('\n')) if 'grid.cells' in line or 'grid' in line]
+
+
+class RobotRegistry:
+    """Registry of the robot algorithms (modules with a robot_epoch function) in a folder.
+    Algorithms are discovered by listing the folder, without importing them. A module is only imported when it is
+    first used and imported again when its file changes, and the static check (find_cheats) is cached per version
+    of a file, so the cost of starting the app and of spawning robots does not grow with the number of algorithms.
+    Algorithms are named by their module name, 'name.py' is accepted as well."""
+
+    def __init__(self, folder=ROBOT_CONFIGS, package='robot_configs'):
+        self.folder = folder
+        self.package = package
+        # (folder mtime, {name: path}), refreshed when files are added or removed:
+        self._listing = (None, {})
+        # name -> ((file mtime, size), module) and ((file mtime, size), errors):
+        self._modules = {}
+        self._checks = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _name(name):
+        return name[:-3] if name.endswith('.py') else name
+
+    def _files(self):
+        mtime = os.stat(self.folder).st_mtime_ns
+        if mtime != self._listing[0]:
+            with os.scandir(self.folder) as entries:
+                files = {entry.name[:-3]: entry.path for entry in entries
+                         if entry.name.endswith('.py') and '__' not in entry.name and entry.is_file()}
+            self._listing = (mtime, files)
+        return self._listing[1]
+
+    def names(self):
+        """Names of all algorithms in the folder, sorted."""
+        return sorted(self._files())
+
+    def __contains__(self, name):
+        return self._name(name) in self._files()
+
+    def _version(self, name):
+        """Path and (mtime, size) of the file of an algorithm, raises KeyError for unknown algorithms."""
+        name = self._name(name)
+        path = self._files().get(name)
+        try:
+            stat = os.stat(path) if path else None
+        except FileNotFoundError:
+            stat = None
+        if stat is None:
+            raise KeyError(name)
+        return path, (stat.st_mtime_ns, stat.st_size)
+
+    def source(self, name):
+        """The source code of an algorithm."""
+        path, version = self._version(name)
+        with open(path) as f:
+            return f.read()
+
+    def validate(self, name):
+        """Error messages of the static check of an algorithm, an empty list if it passed."""
+        path, version = self._version(name)
+        name = self._name(name)
+        with self._lock:
+            cached = self._checks.get(name)
+            if cached is None or cached[0] != version:
+                with open(path) as f:
+                    cached = (version, find_cheats(f.read()))
+                self._checks[name] = cached
+        return cached[1]
+
+    def load(self, name):
+        """The module of an algorithm, imported on first use and whenever its file changed since."""
+        path, version = self._version(name)
+        name = self._name(name)
+        with self._lock:
+            cached = self._modules.get(name)
+            if cached is None or cached[0] != version:
+                # Execute a fresh module, so nothing of an older version is left behind:
+                module_name = f'{self.package}.{name}'
+                spec = importlib.util.spec_from_file_location(module_name, path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                sys.modules[module_name] = module
+                cached = (version, module)
+                self._modules[name] = cached
+        return cached[1]
+
+    def robot_epoch(self, name):
+        """The robot_epoch function of an algorithm."""
+        return self.load(name).robot_epoch
+
+
+# Registry of the robot_configs folder:
+registry = RobotRegistry()
@@ -0,0 +1,54 @@
+// Client side of the delta protocol: the grid is built once from a buffer of cell values and afterwards only the
+// changed cells are patched. The editor sends its cells in the same layout, run-length encoded.
+var materials = {};
+
+function build_grid(container, data, height = 30, width = 30) {
+    // Same layout as templates/grid.html, cells are stored column major (x * n_rows + y):
+    var cells = new Int8Array(data['cells']);
+    materials = data['materials'];
+    var html = ['<div class="grid" style="grid-template-columns: repeat(' + data['n_cols'] + ', ' + height
+    + 'px);grid-template-rows: repeat(' + data['n_rows'] + ', ' + width + 'px);">'];
+    for (var y = 0; y < data['n_rows']; y++) {
+        for (var x = 0; x < data['n_cols']; x++) {
+            html.push('<div class="' + materials[cells[x * data['n_rows'] + y]] + '" id="(' + x + ',' + y
+                + ')" onclick="tile_click(\'' + x + '\', \'' + y + '\')"></div>');
+        }
+    }
+    html.push('</div>');
+    container.innerHTML = html.join('');
+}
+
+function patch_grid(changes) {
+    // changes is a flat list [x, y, value, x, y, value, ...]:
+    for (var i = 0; i < changes.length; i += 3) {
+        var tile = document.getElementById('(' + changes[i] + ',' + changes[i + 1] + ')');
+        if (tile) {
+            tile.className = materials[changes[i + 2]];
+        }
+    }
+}
+
+function encode_rle(cells) {
+    // Runs of equal cell values as a flat list [value, count, value, count, ...]:
+    var runs = [];
+    var i = 0;
+    while (i < cells.length) {
+        var j = i + 1;
+        while (j < cells.length && cells[j] === cells[i]) {
+            j++;
+        }
+        runs.push(cells[i], j - i);
+        i = j;
+    }
+    return runs;
+}
+
+function decode_base64(text) {
+    // A base64 buffer of cell values as an ArrayBuffer, for build_grid:
+    var bytes = atob(text);
+    var buffer = new Uint8Array(bytes.length);
+    for (var i = 0; i < bytes.length; i++) {
+        buffer[i] = bytes.charCodeAt(i);
+    }
+    return buffer.buffer;
+}
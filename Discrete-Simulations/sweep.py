@@ -0,0 +1,212 @@
+"""Parameter sweeps over grids, robot algorithms and robot parameters, with a result cache on disk.
+
+A sweep runs the cross product of grid files, robot algorithms and values of the Robot parameters, every combination
+for the same episode seeds, over a pool of local workers. The result of every episode is stored in the cache under
+the sha256 hash of the grid cells, the source of the algorithm, the parameters and the seed, written atomically as
+soon as the episode finishes. Running a sweep again only runs the episodes that are not in the cache yet, so an
+interrupted sweep resumes where it stopped, and overlapping sweeps share their results:
+    python sweep.py --grids house.grid snake.grid --robots greedy_random_robot distance_field_robot \\
+        --param battery_drain_p 0.1 0.5 --param p_move 0 0.1 --episodes 50 --output sweep.csv
+Only the file of the algorithm itself is hashed. Use --salt to start over after changing code it depends on (like
+environment.py).
+"""
+import argparse
+import ast
+import csv
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+
+from grid_format import load_template
+from headless import Evaluation, episode_seeds, run_episode
+from robot_registry import registry
+
+ROBOT_PARAMS = ('p_move', 'battery_drain_p', 'battery_drain_lam', 'vision')
+
+
+class ResultCache:
+    """Episode results on disk, one JSON file per key in a folder per first two characters of the key."""
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key + '.json')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, result):
+        """Writes to a temporary file that is renamed into place, so an interrupted write never leaves a partial
+        result behind."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(result, f)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+def grid_hash(grid_file):
+    """Hash of the size and cells of a grid, the same for a grid in the old and in the binary format."""
+    cells = load_template(f'grid_configs/{grid_file}').cells
+    digest = hashlib.sha256(str(cells.shape).encode())
+    digest.update(cells.tobytes())
+    return digest.hexdigest()
+
+
+def canonical(value):
+    """value with every number as a float, so equal numbers like 1 and 1.0 give the same key."""
+    if isinstance(value, dict):
+        return {name: canonical(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def episode_key(grid_digest, algorithm_digest, params, seed, salt=''):
+    payload = json.dumps({'grid': grid_digest, 'algorithm': algorithm_digest, 'params': canonical(params), 'seed': seed,
+                          'salt': salt}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def parse_value(text):
+    """A parameter value from the command line: a number (or other Python literal) if possible, else a string."""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def cells(grids, robots, params):
+    """The (grid file, robot algorithm, robot params) combinations of a sweep, params maps a name to its values."""
+    names = sorted(params)
+    for grid_file, robot_alg in itertools.product(grids, robots):
+        for values in itertools.product(*(params[name] for name in names)):
+            yield grid_file, robot_alg, dict(zip(names, values))
+
+
+def _run_job(job):
+    key, seed, kwargs = job
+    return key, run_episode(0, seed, **kwargs)
+
+
+def sweep(grids, robots, params, n_episodes, seed=0, cache='sweep_cache', n_workers=None, salt='', settings=None,
+          progress=print):
+    """Runs every episode of the sweep that is not cached yet. settings are extra arguments for run_episode that
+    are the same for every cell (stopping_criteria, spawn, orientation), they are part of the keys as well.
+    Returns a list of (grid file, robot algorithm, robot params, Evaluation) for all cells."""
+    cache = ResultCache(cache)
+    settings = dict(settings or {})
+    seeds = episode_seeds(seed, n_episodes)
+    grid_digests = {grid_file: grid_hash(grid_file) for grid_file in grids}
+    algorithm_digests = {robot_alg: hashlib.sha256(registry.source(robot_alg).encode()).hexdigest()
+                         for robot_alg in robots}
+    plan, jobs = [], []
+    for grid_file, robot_alg, robot_params in cells(grids, robots, params):
+        key_params = {**settings, 'robot_params': robot_params}
+        keys = [episode_key(grid_digests[grid_file], algorithm_digests[robot_alg], key_params, episode_seed, salt)
+                for episode_seed in seeds]
+        plan.append((grid_file, robot_alg, robot_params, keys))
+        kwargs = {'grid_file': grid_file, 'robot_alg': robot_alg, 'robot_params': robot_params, **settings}
+        jobs.extend((key, episode_seed, kwargs) for key, episode_seed in zip(keys, seeds) if key not in cache)
+    progress(f'{len(plan)} cells, {len(plan) * n_episodes} episodes, {len(jobs)} not in the cache yet.')
+    if jobs:
+        started = time.time()
+        n_workers = n_workers or os.cpu_count()
+        if n_workers == 1:
+            results = map(_run_job, jobs)
+        else:
+            pool = Pool(n_workers)
+            results = pool.imap_unordered(_run_job, jobs, chunksize=max(1, min(16, len(jobs) // (8 * n_workers))))
+        try:
+            for i, (key, result) in enumerate(results):
+                cache.put(key, result)
+                if (i + 1) % 100 == 0 or i + 1 == len(jobs):
+                    progress(f'{i + 1}/{len(jobs)} episodes done ({time.time() - started:.0f}s).')
+        finally:
+            if n_workers != 1:
+                pool.terminate()
+    evaluated = []
+    for grid_file, robot_alg, robot_params, keys in plan:
+        evaluation = Evaluation()
+        for key in keys:
+            evaluation.add(cache.get(key))
+        evaluated.append((grid_file, robot_alg, robot_params, evaluation))
+    return evaluated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a cached sweep over grids, robot algorithms and parameters.')
+    parser.add_argument('--grids', nargs='+', default=['house.grid'], help='grid files in the grid_configs folder')
+    parser.add_argument('--robots', nargs='+', default=['greedy_random_robot'],
+                        help='robot algorithms in the robot_configs folder')
+    parser.add_argument('--param', nargs='+', action='append', default=[], metavar=('NAME', 'VALUE'),
+                        help=f'a Robot parameter ({", ".join(ROBOT_PARAMS)}) and the values to sweep over')
+    parser.add_argument('--episodes', type=int, default=20, help='number of episodes per cell')
+    parser.add_argument('--seed', type=int, default=0, help='master seed the episode seeds are derived from')
+    parser.add_argument('--stopping-criteria', type=float, default=100)
+    parser.add_argument('--spawn', type=int, nargs=2, default=(1, 1), metavar=('X', 'Y'))
+    parser.add_argument('--orientation', default='n', choices=['n', 'e', 's', 'w'])
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--cache', default='sweep_cache', help='folder of the result cache')
+    parser.add_argument('--salt', default='', help='extra text in the cache keys, change it to start over')
+    parser.add_argument('--output', default=None, help='write a summary row per cell to this CSV file')
+    args = parser.parse_args()
+
+    params = {}
+    for name, *values in args.param:
+        if name not in ROBOT_PARAMS:
+            parser.error(f'Unknown robot parameter {name}, use one of {", ".join(ROBOT_PARAMS)}.')
+        if not values:
+            parser.error(f'No values given for {name}.')
+        params[name] = [parse_value(value) for value in values]
+    for robot_alg in args.robots:
+        if robot_alg not in registry:
+            parser.error(f'Robot algorithm {robot_alg} not found!')
+    settings = {'stopping_criteria': args.stopping_criteria, 'spawn': list(args.spawn),
+                'orientation': args.orientation}
+    evaluated = sweep(args.grids, args.robots, params, args.episodes, seed=args.seed, cache=args.cache,
+                      n_workers=args.workers, salt=args.salt, settings=settings)
+
+    rows = []
+    for grid_file, robot_alg, robot_params, evaluation in evaluated:
+        halfwidths = evaluation.halfwidths()
+        rows.append({'grid': grid_file, 'robot': robot_alg, **robot_params, 'episodes': evaluation.n,
+                     'cleaned': evaluation.metrics['cleaned'].mean, 'cleaned_ci': halfwidths['cleaned'],
+                     'efficiency': evaluation.metrics['efficiency'].mean, 'efficiency_ci': halfwidths['efficiency'],
+                     'death_rate': 100 * evaluation.deaths / evaluation.n, 'death_rate_ci': halfwidths['death rate'],
+                     'moves': evaluation.metrics['n_moves'].mean})
+    names = sorted(params)
+    print(f"\n{'grid':<28} {'robot':<24} " + ' '.join(f'{name:>17}' for name in names)
+          + f" {'cleaned':>15} {'efficiency':>15} {'deaths':>15}")
+    for row in rows:
+        print(f"{row['grid']:<28} {row['robot']:<24} " + ' '.join(f'{row[name]!s:>17}' for name in names)
+              + f" {row['cleaned']:>8.2f} +-{row['cleaned_ci']:<4.1f} {row['efficiency']:>8.2f} "
+              f"+-{row['efficiency_ci']:<4.1f} {row['death_rate']:>8.1f} +-{row['death_rate_ci']:<4.1f}")
+    if args.output and rows:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
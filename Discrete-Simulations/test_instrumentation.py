@@ -0,0 +1,33 @@
+"""Checks that the app's /metrics page records the robot phases of a simulation step:
+    python -m pytest test_instrumentation.py
+"""
+import os
+
+# The app finds its grids and robots relative to the working directory:
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+import instrumentation
+
+
+def test_app_step_records_robot_phases():
+    client = app.app.test_client()
+    socket = app.socketio.test_client(app.app)
+    try:
+        client.get('/metrics?enable=1&reset=1')
+        socket.emit('get_grid', {'data': 'house.grid', 'delta': True})
+        # In the corner facing the wall, so the robot has to rotate:
+        socket.emit('get_robot', {'robot_file': 'greedy_random_robot.py', 'determ': '0', 'x_spawns': '1',
+                                  'y_spawns': '1', 'orient': 'n', 'p_drain': '0', 'lam_drain': '0', 'vision': '1',
+                                  'n_robots': '1'})
+        for i in range(5):
+            socket.emit('get_update', {'robot_file': 'greedy_random_robot.py'})
+        phases = client.get('/metrics?format=json').get_json()['phases']
+    finally:
+        socket.disconnect()
+        instrumentation.disable()
+        instrumentation.reset()
+    for name in ('robot_epoch', 'move', 'rotate', 'sensor'):
+        assert phases.get(name, {}).get('count', 0) > 0, f'no {name} phase recorded'
+    # Every epoch of the single robot reads its sensors, which only the wrapped RobotView methods record:
+    assert phases['sensor']['count'] >= phases['robot_epoch']['count'] == 5